@@ -0,0 +1 @@
+"""Performance benchmarks for the newsletter pipeline (run with python -m benchmarks.<name>)."""
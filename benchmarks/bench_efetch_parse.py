@@ -0,0 +1,205 @@
+"""
+Benchmark the streaming efetch parser against the previous BeautifulSoup DOM parser.
+
+    python -m benchmarks.bench_efetch_parse --sizes 100 1000 5000
+
+Both parsers run on the same synthetic efetch payloads; the benchmark checks
+that they produce identical article dicts and reports wall time and peak
+memory for each. Memory is the growth in peak RSS while parsing, measured
+in a fresh process per parser: tracemalloc only sees Python allocations,
+not libxml2's, so it would undercount the lxml parser.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bs4 import BeautifulSoup
+
+from src import corpus
+from src.dates import to_timestamp
+from src.pubmed_fetcher import _parse_efetch
+
+
+def parse_efetch_bs4(content: bytes) -> list[dict]:
+    """
+    The BeautifulSoup parser fetch_pubmed_details used before streaming
+    (reference), kept in step with the fields _parse_article returns.
+    """
+    soup = BeautifulSoup(content, "xml")
+    articles = []
+
+    for article in soup.find_all("PubmedArticle"):
+        medline = article.find("MedlineCitation")
+        if not medline:
+            continue
+
+        pmid_tag = medline.find("PMID")
+        pmid = pmid_tag.get_text(strip=True) if pmid_tag else ""
+
+        title_tag = medline.find("ArticleTitle")
+        title = title_tag.get_text(strip=True) if title_tag else "Untitled"
+
+        abstract_tag = medline.find("Abstract")
+        if abstract_tag:
+            abstract_texts = abstract_tag.find_all("AbstractText")
+            abstract = " ".join(t.get_text(strip=True) for t in abstract_texts)
+        else:
+            abstract = ""
+        if len(abstract) > 600:
+            abstract = abstract[:597] + "..."
+
+        journal_tag = medline.find("Journal")
+        journal = ""
+        if journal_tag:
+            j_title = journal_tag.find("Title") or journal_tag.find("ISOAbbreviation")
+            journal = j_title.get_text(strip=True) if j_title else ""
+
+        pub_date_tag = article.find("PubDate")
+        date_str = ""
+        if pub_date_tag:
+            year = pub_date_tag.find("Year")
+            month = pub_date_tag.find("Month")
+            day = pub_date_tag.find("Day")
+            parts = []
+            if year:
+                parts.append(year.get_text(strip=True))
+            if month:
+                parts.append(month.get_text(strip=True))
+            if day:
+                parts.append(day.get_text(strip=True))
+            if parts:
+                date_str = " ".join(parts)
+            else:
+                medline_date = pub_date_tag.find("MedlineDate")
+                date_str = medline_date.get_text(strip=True) if medline_date else "Unknown"
+
+        added = ""
+        entrez = article.find("PubMedPubDate", PubStatus="entrez")
+        if entrez:
+            try:
+                added = "{:04d}-{:02d}-{:02d}".format(
+                    *(int(entrez.find(part).get_text(strip=True)) for part in ("Year", "Month", "Day"))
+                )
+            except (AttributeError, ValueError):
+                pass
+
+        author_list = medline.find("AuthorList")
+        authors = []
+        if author_list:
+            for auth in author_list.find_all("Author")[:3]:
+                last = auth.find("LastName")
+                init = auth.find("Initials")
+                if last:
+                    name = last.get_text(strip=True)
+                    if init:
+                        name += f" {init.get_text(strip=True)}"
+                    authors.append(name)
+            if len(author_list.find_all("Author")) > 3:
+                authors.append("et al.")
+
+        pub_types = medline.find_all("PublicationType")
+        type_list = [pt.get_text(strip=True) for pt in pub_types]
+
+        articles.append({
+            "title": title,
+            "link": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
+            "description": abstract,
+            "date": date_str,
+            "timestamp": to_timestamp(date_str),
+            "added": added,
+            "source": journal or "PubMed",
+            "authors": ", ".join(authors),
+            "pub_types": type_list,
+            "type": "publication",
+        })
+
+    return articles
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARSERS = {"bs4": parse_efetch_bs4, "stream": _parse_efetch}
+
+# Run in a fresh interpreter, so only the first parse after loading the
+# payload is measured. On Linux the peak comes from VmHWM: ru_maxrss also
+# counts the memory of the (large) parent process at fork, which carries
+# over exec.
+_RSS_CHILD = """
+import resource, sys
+from benchmarks.bench_efetch_parse import PARSERS
+
+def peak():
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # bytes on macOS
+
+with open(sys.argv[2], "rb") as f:
+    content = f.read()
+before = peak()
+PARSERS[sys.argv[1]](content)
+print(peak() - before)
+"""
+
+
+def _peak_rss(parser: str, path: str) -> int:
+    """Bytes by which parsing the payload at `path` raises a fresh process's peak RSS."""
+    out = subprocess.run(
+        [sys.executable, "-c", _RSS_CHILD, parser, path],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return int(out.stdout)
+
+
+def _measure(parser: str, content: bytes, path: str) -> tuple[list[dict], float, int]:
+    """Time one run in this process, then measure peak RSS growth in a fresh one."""
+    started = time.perf_counter()
+    result = PARSERS[parser](content)
+    elapsed = time.perf_counter() - started
+    return result, elapsed, _peak_rss(parser, path)
+
+
+def run(sizes: list[int]) -> list[dict]:
+    """Benchmark both parsers at each payload size; return one result row per size."""
+    rows = []
+    for n in sizes:
+        content = corpus.efetch_xml(corpus.generate_publications(n))
+        with tempfile.NamedTemporaryFile(suffix=".xml") as payload:
+            payload.write(content)
+            payload.flush()
+            old, old_time, old_peak = _measure("bs4", content, payload.name)
+            new, new_time, new_peak = _measure("stream", content, payload.name)
+        if old != new:
+            raise AssertionError(f"Parsers disagree on a {n}-record payload")
+        rows.append({
+            "records": n,
+            "bytes": len(content),
+            "bs4_seconds": old_time,
+            "bs4_peak_bytes": old_peak,
+            "stream_seconds": new_time,
+            "stream_peak_bytes": new_peak,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'payload':>10} {'bs4 s':>8} {'bs4 MB':>8} {'stream s':>9} {'stream MB':>10} {'speedup':>8}")
+    for row in run(args.sizes):
+        print(
+            f"{row['records']:>8} {row['bytes'] / 1e6:>8.1f}MB "
+            f"{row['bs4_seconds']:>8.3f} {row['bs4_peak_bytes'] / 1e6:>8.1f} "
+            f"{row['stream_seconds']:>9.3f} {row['stream_peak_bytes'] / 1e6:>10.1f} "
+            f"{row['bs4_seconds'] / row['stream_seconds']:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark per-issue newsletter rendering with and without the template caches.
+
+    python -m benchmarks.bench_render --issues 20 --items 20
+
+Compares four ways of getting the compiled template for each issue:
+
+    fresh     a new Environment per issue, compiling from source (the old behaviour)
+    bytecode  a new Environment per issue with the on-disk bytecode cache
+              (what a new process pays once the cache is warm)
+    shared    the shared module-level environment from src.formatter
+    email     the shared environment's CSS-inlined email variant
+
+The template context is built once per issue in every mode, so the
+difference is the template compilation cost.
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+from src import corpus
+from src.formatter import TEMPLATE_DIR, _template_context, get_template
+from src.news_fetcher import parse_feed
+from src.pubmed_fetcher import _parse_efetch
+from src.trials_fetcher import _parse_study
+
+
+def sample_issue(items: int, seed: int = 0) -> tuple[list[dict], list[dict], list[dict]]:
+    """Build one issue's worth of news, publications and trials from the synthetic corpora."""
+    now = datetime.now(timezone.utc)
+    feed = corpus.rss_xml(corpus.generate_news(items * 4, seed=seed, now=now), "Bench")
+    cutoff = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    news = [entry["article"] for entry in parse_feed(feed, "Bench", ["MASH", "NASH"], cutoff)][:items]
+    publications = _parse_efetch(corpus.efetch_xml(corpus.generate_publications(items, seed=seed, now=now)))
+    trials = [
+        trial for trial in map(_parse_study, corpus.generate_trials(items, seed=seed, now=now)) if trial
+    ]
+    return news, publications, trials
+
+
+def _time_issues(get, issues: int, sections: tuple) -> tuple[list[float], int]:
+    """Render `issues` issues; return per-issue timings and the rendered HTML size."""
+    timings = []
+    for _ in range(issues):
+        started = time.perf_counter()
+        context = _template_context(*sections, 7, datetime.now(timezone.utc))
+        html = get().render(context)
+        timings.append(time.perf_counter() - started)
+    return timings, len(html.encode("utf-8"))
+
+
+def run(issues: int, items: int) -> dict[str, tuple[list[float], int]]:
+    """Render `issues` issues in each mode; return (per-issue timings, HTML bytes) by mode."""
+    sections = sample_issue(items)
+
+    def fresh():
+        env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True)
+        return env.get_template("newsletter.html")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+        def bytecode():
+            env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True, bytecode_cache=bytecode_cache)
+            return env.get_template("newsletter.html")
+
+        bytecode()  # warm the on-disk cache
+        results = {
+            "fresh": _time_issues(fresh, issues, sections),
+            "bytecode": _time_issues(bytecode, issues, sections),
+        }
+    get_template()  # first use compiles once
+    results["shared"] = _time_issues(get_template, issues, sections)
+    get_template(email=True)
+    results["email"] = _time_issues(lambda: get_template(email=True), issues, sections)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--issues", type=int, default=20, help="Issues rendered per mode")
+    parser.add_argument("--items", type=int, default=20, help="Items per section")
+    args = parser.parse_args()
+
+    results = run(args.issues, args.items)
+    baseline = statistics.median(results["fresh"][0])
+    print(f"{'mode':>9} {'median ms':>10} {'min ms':>8} {'speedup':>8} {'HTML KB':>8}")
+    for mode, (timings, size) in results.items():
+        median = statistics.median(timings)
+        print(
+            f"{mode:>9} {median * 1e3:>10.2f} {min(timings) * 1e3:>8.2f} "
+            f"{baseline / median:>7.1f}x {size / 1024:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
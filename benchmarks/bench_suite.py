@@ -0,0 +1,230 @@
+"""
+Benchmark the newsletter's hot paths at scale and save the results as a JSON baseline.
+
+    python -m benchmarks.bench_suite --output benchmarks/baseline.json
+    python -m benchmarks.bench_suite --compare benchmarks/baseline.json
+
+Corpora are generated at multiples of the curated web_search_fetcher volumes
+(10x, 100x and 1000x by default; 1x is 10 news items, 7 publications and
+5 trials). Each case runs at every scale:
+
+    relevance     _is_clinically_relevant over parsed efetch articles
+    news_dedup    dedupe_titles over articles from overlapping feeds (fetch_all_news)
+    rss_parse     parse_feed over one RSS document, filters included
+    efetch_parse  _parse_efetch over one efetch payload
+    clean_html    _clean_html over every news description
+    render_html   render_newsletter, email and archive variants
+    render_text   render_plain_text
+
+A case runs at least --repeats times, and again until it has run for
+--min-time seconds; the median and minimum are reported, plus both per
+item. Results are always written as JSON (--output). With --compare, the
+per-item minimum (the least noisy of the two) is checked against a saved
+baseline, and the exit status is 1 if any case is more than --threshold
+slower. Timings depend on the machine, so compare against a baseline
+recorded on the same one.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+
+from src import corpus, formatter
+from src.config import DATA_DIR, NEWS_FEEDS
+from src.news_fetcher import _clean_html, dedupe_titles, parse_feed
+from src.pubmed_fetcher import _is_clinically_relevant, _parse_efetch
+from src.trials_fetcher import _parse_study
+from src.web_search_fetcher import get_curated_news, get_curated_publications, get_curated_trials
+
+BASELINE_VERSION = 1
+
+
+class Workload:
+    """Synthetic inputs for every case at one scale, built once before timing."""
+
+    def __init__(self, scale: int, seed: int = 0):
+        now = datetime.now(timezone.utc)
+        self.scale = scale
+        self.keywords = NEWS_FEEDS[0]["keywords"]
+        self.cutoff = now - timedelta(days=30)
+
+        news = corpus.generate_news(len(get_curated_news()) * scale, seed=seed, now=now)
+        self.descriptions = [item["description"] for item in news]
+        self.rss = corpus.rss_xml(news, "Bench")
+        self.news = [entry["article"] for entry in parse_feed(self.rss, "Bench", self.keywords, self.cutoff)]
+        # The same stories as carried by a second and third feed, titled with
+        # different case and punctuation, the way fetch_all_news sees them.
+        self.feed_articles = (
+            self.news
+            + [dict(a, title=a["title"].upper()) for a in self.news[::2]]
+            + [dict(a, title=f"{a['title']}!") for a in self.news[::3]]
+        )
+
+        self.efetch = corpus.efetch_xml(
+            corpus.generate_publications(len(get_curated_publications()) * scale, seed=seed, now=now)
+        )
+        self.articles = _parse_efetch(self.efetch)
+        self.publications = [a for a in self.articles if _is_clinically_relevant(a)]
+        self.trials = [
+            trial for trial in map(
+                _parse_study, corpus.generate_trials(len(get_curated_trials()) * scale, seed=seed, now=now)
+            ) if trial
+        ]
+
+
+# name -> (items processed, workload -> the timed call)
+CASES: dict[str, tuple[Callable[[Workload], int], Callable[[Workload], Callable[[], object]]]] = {
+    "relevance": (
+        lambda w: len(w.articles),
+        lambda w: lambda: [a for a in w.articles if _is_clinically_relevant(a)],
+    ),
+    "news_dedup": (
+        lambda w: len(w.feed_articles),
+        lambda w: lambda: dedupe_titles(w.feed_articles),
+    ),
+    "rss_parse": (
+        lambda w: len(w.descriptions),
+        lambda w: lambda: list(parse_feed(w.rss, "Bench", w.keywords, w.cutoff)),
+    ),
+    "efetch_parse": (
+        lambda w: len(w.articles),
+        lambda w: lambda: _parse_efetch(w.efetch),
+    ),
+    "clean_html": (
+        lambda w: len(w.descriptions),
+        lambda w: lambda: [_clean_html(d) for d in w.descriptions],
+    ),
+    "render_html": (
+        lambda w: len(w.news) + len(w.publications) + len(w.trials),
+        lambda w: lambda: formatter.render_newsletter(w.news, w.publications, w.trials),
+    ),
+    "render_text": (
+        lambda w: len(w.news) + len(w.publications) + len(w.trials),
+        lambda w: lambda: formatter.render_plain_text(w.news, w.publications, w.trials),
+    ),
+}
+
+
+def _time(func: Callable[[], object], repeats: int, min_time: float) -> list[float]:
+    """Call `func` at least `repeats` times and until `min_time` seconds have been spent."""
+    timings = []
+    while len(timings) < repeats or sum(timings) < min_time:
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        return out.stdout.strip()
+    except OSError:
+        return ""
+
+
+def run(scales: list[int], cases: list[str], repeats: int, min_time: float) -> dict:
+    """Time each case at each scale; return the baseline document."""
+    results = {}
+    # render_newsletter archives each issue in OUTPUT_DIR; keep that out of output/.
+    with tempfile.TemporaryDirectory() as output_dir:
+        formatter.OUTPUT_DIR = output_dir
+        for scale in scales:
+            workload = Workload(scale)
+            for name in cases:
+                items, make = CASES[name]
+                timings = _time(make(workload), repeats, min_time)
+                median = statistics.median(timings)
+                n = items(workload)
+                results[f"{name}@{scale}x"] = {
+                    "case": name,
+                    "scale": scale,
+                    "items": n,
+                    "runs": len(timings),
+                    "median_s": round(median, 6),
+                    "min_s": round(min(timings), 6),
+                    "per_item_us": round(median / max(n, 1) * 1e6, 3),
+                    "min_per_item_us": round(min(timings) / max(n, 1) * 1e6, 3),
+                }
+                print(
+                    f"{name:>13} {scale:>6}x {n:>7} {median * 1e3:>11.2f} "
+                    f"{min(timings) * 1e3:>9.2f} {median / max(n, 1) * 1e6:>11.2f}",
+                    flush=True,
+                )
+    return {
+        "version": BASELINE_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Print per-item ratios (of the minimum) against `baseline`; return the cases slower than `threshold`."""
+    regressions = []
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('created', '?')[:19]}):")
+    print(f"{'case':>20} {'baseline us':>12} {'current us':>11} {'ratio':>7}")
+    for key, result in current["results"].items():
+        before = baseline.get("results", {}).get(key)
+        if not before:
+            print(f"{key:>20} {'-':>12} {result['min_per_item_us']:>11.2f}     new")
+            continue
+        ratio = result["min_per_item_us"] / before["min_per_item_us"] if before["min_per_item_us"] else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(f"{key:>20} {before['min_per_item_us']:>12.2f} {result['min_per_item_us']:>11.2f} {ratio:>6.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Multiples of the curated volumes")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeats", type=int, default=3, help="Minimum runs per case")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Minimum seconds spent per case")
+    parser.add_argument("--output", default=os.path.join(DATA_DIR, "benchmarks", "latest.json"),
+                        help="Where to write the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline JSON to check the results against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Slowdown per item counted as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)  # e.g. a missing branding image would warn on every render
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"{'case':>13} {'scale':>7} {'items':>7} {'median ms':>11} {'min ms':>9} {'us / item':>11}")
+    current = run(args.scales, args.cases, args.repeats, args.min_time)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(current, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) more than {args.threshold:.0%} slower: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Check run.py's cold-start imports against a per-mode budget.
+
+    python -m benchmarks.check_startup
+    python -m benchmarks.check_startup --runs 5 --slack 2.0
+
+Starts run.py under `python -X importtime` for each mode below and reads
+the import log it writes to stderr. A mode fails if it imports a module it
+should not load yet (the fetchers' HTTP and parsing libraries, jinja2,
+smtplib), or if its total import time is over budget. --schedule is
+stopped once the scheduler is up, before any job runs. Every process gets
+a fresh MASH_DATA_DIR. The --curated run writes its dry-run issue to
+output/ as usual.
+
+Import time is the lowest of --runs runs. The budgets have headroom for
+slower CI runners; --slack scales them all.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import NamedTuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("requests", "bs4", "lxml", "dateutil", "jinja2", "PIL", "smtplib")
+
+
+class Mode(NamedTuple):
+    args: list[str]
+    budget_ms: float
+    allowed: tuple[str, ...] = ()  # heavy modules this mode needs
+    ready: str = ""  # stop the process at this stderr line instead of waiting for it to exit
+
+
+MODES = {
+    "--help": Mode(["--help"], 150),
+    "--curated": Mode(["--curated", "--dry-run"], 300, allowed=("jinja2", "PIL")),
+    "--schedule": Mode(["--schedule", "--dry-run"], 150, ready="Scheduler running"),
+}
+
+
+def _importtime(mode: Mode) -> tuple[float, set[str]]:
+    """Run one cold start; return (total import ms, imported module names)."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        proc = subprocess.Popen(
+            [sys.executable, "-X", "importtime", "run.py", *mode.args],
+            cwd=ROOT, env={**os.environ, "MASH_DATA_DIR": data_dir},
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        log = []
+        for line in proc.stderr:
+            log.append(line)
+            if mode.ready and mode.ready in line:
+                proc.terminate()
+                break
+        proc.stderr.close()
+        status = proc.wait(timeout=60)
+    if status and not mode.ready:
+        raise RuntimeError(f"run.py {' '.join(mode.args)} exited with {status}:\n{''.join(log[-20:])}")
+
+    total_us = 0
+    modules = set()
+    for line in log:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.add(name.strip())
+        if not name.startswith("  "):  # top level: its cumulative time covers everything below it
+            total_us += int(cumulative)
+    return total_us / 1e3, modules
+
+
+def check(names: list[str], runs: int, slack: float) -> list[str]:
+    """Measure each mode; print a table and return the failures."""
+    failures = []
+    print(f"{'mode':>11} {'import ms':>10} {'budget ms':>10}  heavy modules")
+    for name in names:
+        mode = MODES[name]
+        timings, loaded = [], set()
+        for _ in range(runs):
+            ms, modules = _importtime(mode)
+            timings.append(ms)
+            loaded |= {m for m in modules if m.split(".")[0] in HEAVY}
+        heavy = sorted({m.split(".")[0] for m in loaded})
+        budget = mode.budget_ms * slack
+        print(f"{name:>11} {min(timings):>10.1f} {budget:>10.0f}  {', '.join(heavy) or '-'}")
+
+        unexpected = [m for m in heavy if m not in mode.allowed]
+        if unexpected:
+            failures.append(f"{name} imports {', '.join(unexpected)}")
+        if min(timings) > budget:
+            failures.append(f"{name} spends {min(timings):.0f} ms importing (budget {budget:.0f} ms)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts per mode; the fastest counts")
+    parser.add_argument("--slack", type=float, default=1.0, help="Multiplier applied to every budget")
+    args = parser.parse_args()
+
+    failures = check(args.modes, args.runs, args.slack)
+    if failures:
+        print("\nStartup check failed:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nStartup check passed.")
+
+
+if __name__ == "__main__":
+    main()
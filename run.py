@@ -5,23 +5,41 @@ MASH Newsletter Agent - Main Entry Point
 Usage:
     python run.py              # Generate and send newsletter now
     python run.py --now        # Same as above (explicit)
-    python run.py --schedule   # Start the weekly scheduler (runs every Monday)
+    python run.py --schedule   # Start the scheduler (daily ingest, send every Monday)
+    python run.py --daemon     # Ingest continuously, send every Monday from the store
     python run.py --dry-run    # Generate newsletter but don't email it
     python run.py --curated    # Use curated web-search data instead of live APIs
+    python run.py --replay     # Render from the item store without fetching (with --no-store: from the HTTP cache)
+    python run.py --flush-outbox  # Resend newsletters still queued in the outbox
 """
 
 import argparse
 import logging
+import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import ExitStack, nullcontext
+from datetime import datetime, timezone
+from typing import Callable, Optional
 
-from src.news_fetcher import fetch_all_news
-from src.pubmed_fetcher import fetch_all_publications
-from src.trials_fetcher import fetch_all_trials
+# Only lightweight modules are imported here. The fetchers (requests, lxml,
+# bs4, dateutil), the renderer (jinja2) and the email modules (smtplib) are
+# imported by the code paths that use them, so --help, --curated and
+# --schedule start without loading what they don't need yet
+# (checked by benchmarks/check_startup.py).
 from src.web_search_fetcher import fetch_all_curated_content
-from src.formatter import render_newsletter, render_plain_text
-from src.emailer import send_newsletter
-from src.scheduler import start_scheduler
-from src.config import LOOKBACK_DAYS, RECIPIENT_EMAIL
+from src.dates import to_timestamp
+from src.dedup import deduplicate_sources
+from src.scheduler import Scheduler, daily, every, weekly
+from src.item_store import item_store
+from src.instrumentation import bound, count, current, run_metrics, span
+from src.config import (
+    LOOKBACK_DAYS, RECIPIENT_EMAILS, SOURCE_DEADLINES, OUTPUT_DIR,
+    SEND_DAY, SEND_TIME, INGEST_TIME, PREFETCH_MAX_AGE,
+    INGEST_SCHEDULE, INGEST_STALE_AFTER, OUTBOX_RUN_WAIT_SECONDS, HTTP_REPLAY,
+)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -30,67 +48,339 @@ logging.basicConfig(
 )
 logger = logging.getLogger("mash-newsletter")
 
+LIVE_SOURCES = ("news", "publications", "trials")
+# One ingest per source at a time (daemon jobs and the send's top-up)
+_INGEST_LOCKS = {name: threading.Lock() for name in LIVE_SOURCES}
+
+
+def _fetcher(name: str, use_store: bool = False) -> Callable[[int], list[dict]]:
+    """
+    The fetch function for a live source, importing its module on first use.
+    With use_store, publications are searched by the date PubMed added them
+    and trials are diffed against the item store's snapshots.
+    """
+    if name == "news":
+        from src.news_fetcher import fetch_all_news
+        return fetch_all_news
+    if name == "publications":
+        if use_store:
+            from src.pubmed_fetcher import fetch_new_publications
+            return fetch_new_publications
+        from src.pubmed_fetcher import fetch_all_publications
+        return fetch_all_publications
+    if use_store:
+        from src.trials_fetcher import fetch_trial_updates
+        return fetch_trial_updates
+    from src.trials_fetcher import fetch_all_trials
+    return fetch_all_trials
+
+
+def _fetch_source(name: str, fetch: Callable[[int], list[dict]], lookback_days: int) -> list[dict]:
+    with span("fetch", source=name):
+        items = fetch(lookback_days)
+    count("items.fetched", len(items), source=name)
+    return items
+
+
+def fetch_live_sources(
+    lookback_days: int | dict[str, int] = LOOKBACK_DAYS, use_store: bool = False
+) -> dict[str, list[dict]]:
+    """
+    Fetch all live sources concurrently, each bounded by its own deadline.
+
+    `lookback_days` is either one window for every source or a dict of
+    per-source windows, which also selects the sources to fetch. Returns a
+    dict of source name -> items; a source that fails or misses its deadline
+    is left out, and the others are unaffected. use_store selects the
+    fetchers used to fill the item store (see _fetcher).
+    """
+    if isinstance(lookback_days, int):
+        lookback_days = dict.fromkeys(LIVE_SOURCES, lookback_days)
+    # Imported before the deadlines start, rather than inside the workers.
+    fetchers = {name: _fetcher(name, use_store) for name in lookback_days}
+    executor = ThreadPoolExecutor(max_workers=len(lookback_days), thread_name_prefix="fetch")
+    started = time.monotonic()
+    futures = {
+        name: executor.submit(bound(_fetch_source), name, fetchers[name], days)
+        for name, days in lookback_days.items()
+    }
+
+    results = {}
+    for name, future in futures.items():
+        remaining = max(0.0, started + SOURCE_DEADLINES[name] - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+            logger.info("Found %d %s (%.1fs)", len(results[name]), name, time.monotonic() - started)
+        except FutureTimeout:
+            logger.warning(
+                "Source '%s' missed its %ds deadline - continuing without it",
+                name, SOURCE_DEADLINES[name],
+            )
+        except Exception as e:
+            logger.error("Source '%s' failed: %s", name, e)
+
+    # Don't block on stragglers; their own request timeouts bound them.
+    executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
+def ingest_live_sources(
+    lookback_days: int = LOOKBACK_DAYS, sources: Optional[list[str]] = None
+) -> dict[str, int]:
+    """
+    Fetch each live source (or just `sources`) from its watermark and add
+    the results to the item store.
+
+    Returns source name -> number of new or revised items. A source's
+    watermark advances whenever its fetch succeeds, empty or not; a fetch
+    that fails or misses its deadline leaves it where it was, and so does
+    a news fetch with any failed feed, so that feed's items are picked up
+    once it is back.
+    """
+    names = [name for name in LIVE_SOURCES if sources is None or name in sources]
+    with ExitStack() as locks:
+        for name in names:
+            locks.enter_context(_INGEST_LOCKS[name])
+        lookbacks = {name: item_store.lookback_for(name, lookback_days) for name in names}
+        logger.info(
+            "Incremental fetch windows (days): %s",
+            ", ".join(f"{name}={days}" for name, days in lookbacks.items()),
+        )
+        started = time.time()
+        results = fetch_live_sources(lookbacks, use_store=True)
+
+        changed = {}
+        for name, items in results.items():
+            changed[name] = item_store.upsert(name, items)
+            if name == "trials":
+                # Only now that the trial updates are stored (see fetch_trial_updates)
+                item_store.save_trial_snapshots(items.snapshots)
+            if name == "news" and items.failed_feeds:
+                logger.warning(
+                    "Keeping the news watermark: %s failed", ", ".join(items.failed_feeds)
+                )
+            else:
+                item_store.set_watermark(name, started)
+            logger.info("Stored %d new or revised %s", changed[name], name)
+    return changed
+
+
+def _select_unsent(lookback_days: int) -> tuple[list[dict], list[dict], list[dict]]:
+    """Load undelivered items collected within the lookback window from the item store."""
+    since = time.time() - lookback_days * 86400
+    sections = []
+    for name in LIVE_SOURCES:
+        items = item_store.unsent(name, since)
+        for item in items:
+            # Items stored before timestamps were recorded
+            if "timestamp" not in item:
+                item["timestamp"] = to_timestamp(item.get("date", ""))
+        items.sort(key=lambda x: x["timestamp"], reverse=True)
+        sections.append(items)
+    return sections[0], sections[1], sections[2]
+
 
 def generate_and_send(
     dry_run: bool = False,
     lookback_days: int = LOOKBACK_DAYS,
     use_curated: bool = False,
+    use_store: bool = True,
+    ingest: bool | list[str] = True,
 ) -> str:
-    """Core pipeline: fetch -> format -> send. Returns the output filepath."""
+    """
+    Core pipeline: fetch -> format -> send. Returns the output filepath.
+
+    With use_store, live sources are fetched incrementally into the item
+    store and the issue contains only items that have not been sent before.
+    ingest=False skips that fetch when the store was just filled (scheduled
+    prefetch), and a list of source names fetches only those.
+
+    Every run, failed or not, writes a JSON report of its timings and
+    counters next to the newsletter HTML (<issue>.run.json). The report
+    has the run's own metrics only, not those of concurrent jobs.
+    """
+    with run_metrics() as metrics:
+        metrics.info.update(
+            dry_run=dry_run, lookback_days=lookback_days, curated=use_curated, store=use_store, ingest=ingest
+        )
+        try:
+            filepath = _run_pipeline(dry_run, lookback_days, use_curated, use_store, ingest)
+            metrics.info["status"] = "ok"
+            return filepath
+        except Exception as e:
+            metrics.info.update(status="failed", error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            from src.formatter import issue_path
+            output = metrics.info.get("output") or issue_path(datetime.now(timezone.utc))
+            metrics.write_report(f"{os.path.splitext(output)[0]}.run.json")
+
+
+def _run_pipeline(
+    dry_run: bool, lookback_days: int, use_curated: bool, use_store: bool, ingest: bool | list[str]
+) -> str:
+    metrics = current()
     logger.info("=" * 60)
     logger.info("MASH Newsletter Agent - Starting collection")
     logger.info("Looking back %d days", lookback_days)
     logger.info("=" * 60)
 
-    if use_curated:
-        logger.info("Using curated web-search content...")
-        news, publications, trials = fetch_all_curated_content()
-    else:
-        # 1. Fetch from all live sources
-        logger.info("Fetching industry news from RSS feeds...")
-        news = fetch_all_news(lookback_days)
-        logger.info("Found %d news articles", len(news))
-
-        logger.info("Fetching publications from PubMed...")
-        publications = fetch_all_publications(lookback_days)
-        logger.info("Found %d publications", len(publications))
-
-        logger.info("Fetching clinical trial updates...")
-        trials = fetch_all_trials(lookback_days)
-        logger.info("Found %d trial updates", len(trials))
-
-        # If live sources returned nothing, fall back to curated
-        total_live = len(news) + len(publications) + len(trials)
-        if total_live == 0:
-            logger.warning("Live sources returned 0 results. Falling back to curated content.")
+    from_store = False
+    with span("stage", stage="fetch"):
+        if use_curated:
+            logger.info("Using curated web-search content...")
             news, publications, trials = fetch_all_curated_content()
+        else:
+            # 1. Fetch from all live sources concurrently
+            logger.info("Fetching RSS news, PubMed publications and trial updates...")
+            if use_store:
+                if ingest:
+                    ingest_live_sources(lookback_days, None if ingest is True else ingest)
+                news, publications, trials = _select_unsent(lookback_days)
+                from_store = True
+            else:
+                results = fetch_live_sources(lookback_days)
+                news = results.get("news", [])
+                publications = results.get("publications", [])
+                trials = results.get("trials", [])
+
+            # If live sources returned nothing, fall back to curated
+            total_live = len(news) + len(publications) + len(trials)
+            if total_live == 0:
+                logger.warning("Live sources returned 0 results. Falling back to curated content.")
+                news, publications, trials = fetch_all_curated_content()
+                from_store = False
+                metrics.info["curated_fallback"] = True
+
+    # Collapse the same story reported by several outlets or sources
+    with span("stage", stage="dedup"):
+        news, publications, trials = deduplicate_sources(news, publications, trials)
 
     total = len(news) + len(publications) + len(trials)
     logger.info("Total items collected: %d", total)
+    metrics.info["items"] = {"news": len(news), "publications": len(publications), "trials": len(trials)}
 
     # 2. Render newsletter
+    from src.formatter import render_newsletter, render_plain_text
     logger.info("Rendering newsletter...")
-    html_content, filepath = render_newsletter(news, publications, trials, lookback_days)
-    plain_text = render_plain_text(news, publications, trials)
+    with span("stage", stage="render"):
+        html_content, filepath = render_newsletter(news, publications, trials, lookback_days)
+        plain_text = render_plain_text(news, publications, trials)
+    metrics.info["output"] = filepath
     logger.info("Newsletter rendered: %s", filepath)
 
     # 3. Send email (unless dry-run)
     if dry_run:
         logger.info("DRY RUN - Newsletter not emailed. Saved to: %s", filepath)
     else:
-        sent = send_newsletter(html_content, plain_text, RECIPIENT_EMAIL)
-        if sent:
-            logger.info("Newsletter emailed to %s", RECIPIENT_EMAIL)
-        else:
+        # Spool the built message before sending, so a failed delivery can be
+        # retried (--flush-outbox) without fetching or rendering again. The
+        # outbox marks the items sent once the issue first reaches someone.
+        from src.emailer import build_message
+        from src.images import newsletter_images
+        from src.outbox import outbox, PENDING, REJECTED, SENT
+        issue_id = os.path.splitext(os.path.basename(filepath))[0]
+        with span("stage", stage="send"):
+            message = build_message(html_content, plain_text, images=newsletter_images())
+            outbox.spool(
+                issue_id, message, RECIPIENT_EMAILS, filepath,
+                items=news + publications + trials if from_store else None,
+            )
+            counts = outbox.flush(max_wait=OUTBOX_RUN_WAIT_SECONDS, issue_ids=[issue_id]).get(issue_id, {})
+        metrics.info["delivery"] = counts
+        undelivered = counts.get(PENDING, 0) + counts.get(REJECTED, 0)
+        if undelivered:
             logger.error(
-                "EMAIL FAILED - check SMTP secrets in GitHub repo settings. "
-                "Newsletter saved to: %s", filepath
+                "EMAIL FAILED for %d recipient(s) - check SMTP secrets in GitHub repo settings. "
+                "Newsletter saved to: %s", undelivered, filepath
             )
+            if counts.get(PENDING):
+                logger.error("Undelivered messages stay in the outbox; resend with: python run.py --flush-outbox")
             raise RuntimeError("Newsletter email failed to send. Check the logs above for details.")
+        logger.info("Newsletter emailed to %d recipient(s)", counts.get(SENT, 0))
 
     return filepath
 
 
+def run_scheduler(dry_run: bool, use_curated: bool, use_store: bool) -> None:
+    """
+    Ingest live sources daily at INGEST_TIME and send weekly at SEND_TIME.
+
+    The ingest run before the send slot is its prefetch: the send then only
+    selects from the store, renders and sends. Without the item store the
+    ingest still warms the HTTP cache for the send's own fetch.
+    """
+    last_ingest = {"finished": 0.0}
+
+    def ingest():
+        if use_store:
+            ingest_live_sources(LOOKBACK_DAYS)
+        else:
+            fetch_live_sources(LOOKBACK_DAYS)
+        last_ingest["finished"] = time.time()
+
+    def send():
+        prefetched = time.time() - last_ingest["finished"] < PREFETCH_MAX_AGE.total_seconds()
+        generate_and_send(dry_run=dry_run, use_curated=use_curated, use_store=use_store, ingest=not prefetched)
+
+    scheduler = Scheduler()
+    if not use_curated:
+        scheduler.add("ingest", ingest, daily(INGEST_TIME), group="newsletter")
+    scheduler.add("send", send, weekly(SEND_DAY, SEND_TIME), group="newsletter")
+    logger.info("Ingesting daily at %s; sending every %s at %s", INGEST_TIME, SEND_DAY, SEND_TIME)
+    logger.info("Scheduler running. Press Ctrl+C to stop.")
+    scheduler.run()
+
+
+def run_daemon(dry_run: bool) -> None:
+    """
+    Ingest each live source into the item store on its own rolling interval
+    (INGEST_SCHEDULE), and render the weekly issue from the store.
+
+    Fetching is spread across the week, so one bad hour at a source only
+    delays its items until the next run. The send does no network I/O
+    unless a source has not been ingested within INGEST_STALE_AFTER, in
+    which case that source is fetched first.
+    """
+    def send():
+        cutoff = time.time() - INGEST_STALE_AFTER.total_seconds()
+        stale = [name for name in LIVE_SOURCES if (item_store.watermark(name) or 0) < cutoff]
+        if stale:
+            logger.warning("No recent ingest for %s - fetching before the send", ", ".join(stale))
+        # The stale fetch is part of the send's run, and of its report.
+        generate_and_send(dry_run=dry_run, use_store=True, ingest=stale)
+
+    scheduler = Scheduler()
+    for name, (interval, offset) in INGEST_SCHEDULE.items():
+        # Each source is its own job group, so a slow source delays nobody else.
+        scheduler.add(
+            f"ingest-{name}", lambda name=name: ingest_live_sources(LOOKBACK_DAYS, [name]), every(interval, offset)
+        )
+        logger.info("Ingesting %s every %s", name, interval)
+    scheduler.add("send", send, weekly(SEND_DAY, SEND_TIME))
+    logger.info("Sending every %s at %s from the item store", SEND_DAY, SEND_TIME)
+    logger.info("Daemon running. Press Ctrl+C to stop.")
+    scheduler.run()
+
+
+def flush_outbox() -> None:
+    """Deliver every spooled issue to its remaining recipients, retries included."""
+    from src.outbox import outbox, PENDING, REJECTED, SENT
+    summary = outbox.flush(force=True)
+    if not summary:
+        logger.info("Outbox is empty")
+        return
+    pending = 0
+    for issue_id, counts in summary.items():
+        logger.info(
+            "Issue %s: %d sent, %d pending, %d rejected",
+            issue_id, counts[SENT], counts[PENDING], counts[REJECTED],
+        )
+        pending += counts[PENDING]
+    if pending:
+        raise RuntimeError(f"{pending} message(s) still undelivered in the outbox.")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="MASH Newsletter Agent - Weekly MASH/NASH intelligence digest"
@@ -101,7 +391,11 @@ def main():
     )
     parser.add_argument(
         "--schedule", action="store_true",
-        help="Start the weekly scheduler (runs every Monday at 7 AM)"
+        help="Start the scheduler (daily ingest, weekly send every Monday at 7 AM)"
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="Ingest live sources continuously into the item store and send weekly from it"
     )
     parser.add_argument(
         "--dry-run", action="store_true",
@@ -115,18 +409,59 @@ def main():
         "--lookback", type=int, default=LOOKBACK_DAYS,
         help=f"Number of days to look back (default: {LOOKBACK_DAYS})"
     )
+    parser.add_argument(
+        "--no-store", action="store_true",
+        help="Fetch the full lookback window and include items already sent in earlier issues"
+    )
+    parser.add_argument(
+        "--replay", action="store_true",
+        help="Serve PubMed, ClinicalTrials.gov and RSS responses only from the local cache (offline); "
+             "with the item store, render from it without fetching"
+    )
+    parser.add_argument(
+        "--flush-outbox", action="store_true",
+        help="Resend newsletters still waiting in the outbox, without fetching or rendering"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Profile the run with cProfile and tracemalloc (dumps to output/profile_*)"
+    )
     args = parser.parse_args()
 
-    if args.schedule:
-        logger.info("Starting weekly scheduler...")
-        start_scheduler(
-            lambda: generate_and_send(dry_run=args.dry_run, use_curated=args.curated)
-        )
+    if args.replay:
+        from src.http_cache import http_cache
+        http_cache.replay = True
+
+    profile = nullcontext()
+    if args.profile:
+        from src.instrumentation import profiling
+        profile = profiling(os.path.join(OUTPUT_DIR, f"profile_{datetime.now():%Y%m%d_%H%M%S}"))
+    with profile:
+        _dispatch(parser, args)
+
+
+def _dispatch(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    if args.flush_outbox:
+        flush_outbox()
+        return
+
+    if args.daemon:
+        if args.curated or args.no_store:
+            parser.error("--daemon ingests live sources into the item store; drop --curated / --no-store")
+        logger.info("Starting ingestion daemon...")
+        run_daemon(args.dry_run)
+    elif args.schedule:
+        logger.info("Starting scheduler...")
+        run_scheduler(args.dry_run, args.curated, use_store=not args.no_store)
     else:
+        # An incremental fetch asks for windows the cache has never seen, so
+        # replaying with the item store renders from what it already holds.
         filepath = generate_and_send(
             dry_run=args.dry_run,
             lookback_days=args.lookback,
             use_curated=args.curated,
+            use_store=not args.no_store,
+            ingest=not (args.replay or HTTP_REPLAY),
         )
         print(f"\nNewsletter saved to: {filepath}")
 
@@ -1,6 +1,7 @@
 """Configuration for the MASH Newsletter Agent."""
 
 import os
+import re
 from datetime import timedelta
 
 # --- Email Configuration ---
@@ -10,16 +11,65 @@ SMTP_USER = os.environ.get("SMTP_USER", "")
 SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD", "")
 SENDER_EMAIL = os.environ.get("SENDER_EMAIL", SMTP_USER)
 RECIPIENT_EMAIL = os.environ.get("RECIPIENT_EMAIL", "don@nuecura.com")
+# Distribution list: comma-separated RECIPIENT_EMAILS, or just RECIPIENT_EMAIL
+RECIPIENT_EMAILS = [
+    addr.strip() for addr in (os.environ.get("RECIPIENT_EMAILS") or RECIPIENT_EMAIL).split(",") if addr.strip()
+]
+# Bulk delivery: authenticated SMTP connections shared by the sending threads,
+# the provider's per-minute send limit, and how many messages one connection
+# carries before it is re-established (servers cap messages per session)
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", "4"))
+SMTP_SENDS_PER_MINUTE = int(os.environ.get("SMTP_SENDS_PER_MINUTE", "120"))
+SMTP_MESSAGES_PER_CONNECTION = 100
+# Inline the template's CSS into the email HTML for clients that strip <style>
+EMAIL_INLINE_CSS = True
+# Gmail clips messages larger than this; warn when an issue exceeds it
+EMAIL_CLIP_BYTES = 102 * 1024
 
 # --- Schedule ---
 SEND_DAY = "monday"
 SEND_TIME = "07:00"  # 7 AM
+# Live sources are ingested into the item store every day at INGEST_TIME.
+# On SEND_DAY this is the prefetch for the send slot, which then only renders
+# and sends if the ingest finished within PREFETCH_MAX_AGE.
+INGEST_TIME = "06:30"
+PREFETCH_MAX_AGE = timedelta(hours=2)
+# Daemon mode (run.py --daemon): each live source is ingested on its own
+# (interval, offset past midnight), staggered so they don't fetch at once.
+# The weekly send then renders from the store, fetching only a source whose
+# last successful ingest is older than INGEST_STALE_AFTER.
+INGEST_SCHEDULE = {
+    "news": (timedelta(hours=1), timedelta(minutes=5)),
+    "publications": (timedelta(hours=6), timedelta(minutes=20)),
+    "trials": (timedelta(hours=6), timedelta(minutes=40)),
+}
+INGEST_STALE_AFTER = timedelta(days=1)
+# A slot missed while the scheduler was down runs on restart if it is at most this old
+SCHEDULER_CATCH_UP = timedelta(days=1)
+# Longest single sleep (seconds), so clock jumps and suspends are noticed
+SCHEDULER_MAX_SLEEP = 600
 
 # --- Content lookback window ---
 LOOKBACK_DAYS = 7
 
+# --- Live source deadlines (seconds) ---
+# The three live sources are fetched concurrently; a source that has not
+# finished within its deadline is dropped from the issue instead of holding
+# up the others.
+SOURCE_DEADLINES = {
+    "news": 60,
+    "publications": 90,
+    "trials": 60,
+}
+
 # --- PubMed / NCBI ---
 PUBMED_BASE = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+# NCBI allows 3 requests/second without an API key and 10 with one.
+NCBI_API_KEY = os.environ.get("NCBI_API_KEY", "")
+NCBI_REQUESTS_PER_SECOND = float(
+    os.environ.get("NCBI_REQUESTS_PER_SECOND", "10" if NCBI_API_KEY else "3")
+)
+NCBI_MAX_RETRIES = 3
 PUBMED_SEARCH_TERMS = [
     # Focus on human clinical studies Phase 2+, exclude animal/cell biology
     '("MASH"[Title/Abstract] OR "metabolic dysfunction-associated steatohepatitis"[Title/Abstract]) AND ("clinical trial, phase ii"[Publication Type] OR "clinical trial, phase iii"[Publication Type] OR "clinical trial, phase iv"[Publication Type] OR "randomized controlled trial"[Publication Type] OR "meta-analysis"[Publication Type] OR "practice guideline"[Publication Type] OR "systematic review"[Publication Type]) NOT ("mice"[Title] OR "mouse"[Title] OR "murine"[Title] OR "rat"[Title] OR "rats"[Title] OR "in vitro"[Title] OR "cell line"[Title] OR "hepatocyte"[Title])',
@@ -27,6 +77,12 @@ PUBMED_SEARCH_TERMS = [
     '("fatty liver disease"[Title/Abstract] OR "MASLD"[Title/Abstract] OR "NAFLD"[Title/Abstract]) AND ("clinical management"[Title/Abstract] OR "patient care"[Title/Abstract] OR "diagnosis"[Title/Abstract] OR "treatment guideline"[Title/Abstract]) AND "humans"[MeSH Terms]',
 ]
 PUBMED_MAX_RESULTS = 15
+# Lookbacks longer than this combine the searches on the E-utilities history
+# server and stream every match back in efetch batches instead of taking the
+# newest PUBMED_MAX_RESULTS per term.
+PUBMED_HISTORY_MIN_LOOKBACK = 30
+PUBMED_HISTORY_MAX_RECORDS = 10000
+PUBMED_EFETCH_BATCH = 200
 
 # --- ClinicalTrials.gov v2 API ---
 CTGOV_API_BASE = "https://clinicaltrials.gov/api/v2/studies"
@@ -34,7 +90,8 @@ CTGOV_SEARCH_TERMS = [
     "MASH OR metabolic dysfunction-associated steatohepatitis",
     "NASH steatohepatitis",
 ]
-CTGOV_MAX_RESULTS = 15
+# Results are paged with nextPageToken until exhausted; 1000 is the v2 maximum.
+CTGOV_PAGE_SIZE = 1000
 
 # --- Content relevance filters ---
 # Articles MUST contain at least one of these DISEASE terms to be included.
@@ -60,10 +117,34 @@ EXCLUSION_KEYWORDS = [
     "preclinical", "animal study", "animal model",
 ]
 
+# Near-duplicate clustering across sources: titles with Jaccard similarity
+# (word unigrams + bigrams) at or above DEDUP_SIMILARITY are merged. LSH uses
+# DEDUP_BANDS bands of DEDUP_ROWS MinHash rows; (1/bands)^(1/rows) ~ 0.5.
+DEDUP_SIMILARITY = 0.5
+DEDUP_BANDS = 16
+DEDUP_ROWS = 4
+# When merging, keep the first type in this list as the representative.
+DEDUP_TYPE_PRIORITY = ["publication", "clinical_trial", "industry_news"]
+
 # Clinical trials: only include these phases (exclude Phase 1 / Early Phase 1)
 TRIAL_INCLUDED_PHASES = ["PHASE2", "PHASE3", "PHASE4", "NA"]
+# A trial is reported only when one of these fields changed since the last
+# run (or it is new). Keys are trial dict fields, values the v2 API fields
+# fetched in the first, lightweight pass.
+TRIAL_DIFF_FIELDS = {
+    "status": "OverallStatus",
+    "phase": "Phase",
+    "sponsor": "LeadSponsorName",
+}
+# NCT IDs per filter.ids request when fetching full records of changed trials
+CTGOV_IDS_BATCH = 100
 
 # --- RSS / News Feeds ---
+# Feeds are fetched in parallel over one pooled keep-alive session.
+NEWS_FETCH_WORKERS = 8
+# Stop parsing a newest-first feed after this many consecutive items older
+# than the lookback cutoff.
+FEED_EARLY_STOP_STALE = 3
 NEWS_FEEDS = [
     {
         "name": "FiercePharma",
@@ -97,6 +178,22 @@ NEWS_FEEDS = [
     },
 ]
 
+
+def feed_slug(name: str) -> str:
+    """URL-safe identifier for a feed, e.g. "BioPharma Dive" -> "biopharma-dive"."""
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+# --- Offline fixtures ---
+# Point PubMed, ClinicalTrials.gov and every RSS feed at a local fixture
+# server (see src/fixture_server.py) instead of the live internet.
+FIXTURE_URL = os.environ.get("MASH_FIXTURE_URL", "").rstrip("/")
+if FIXTURE_URL:
+    PUBMED_BASE = f"{FIXTURE_URL}/entrez/eutils"
+    CTGOV_API_BASE = f"{FIXTURE_URL}/api/v2/studies"
+    for _feed in NEWS_FEEDS:
+        _feed["url"] = f"{FIXTURE_URL}/feeds/{feed_slug(_feed['name'])}"
+
 # --- Web search fallback keywords ---
 WEB_SEARCH_QUERIES = [
     "MASH metabolic steatohepatitis drug clinical trial 2025 2026",
@@ -108,6 +205,55 @@ WEB_SEARCH_QUERIES = [
 ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets")
 HEADSHOT_PATH = os.path.join(ASSETS_DIR, "dr_lazas_headshot.jpg")
 LOGO_PATH = os.path.join(ASSETS_DIR, "dhr_logo.png")
+# Template name -> (source file, CSS display size (width, height), fit).
+# Images are resized once to twice the display size for high-DPI screens;
+# "cover" fills the box (cropped by CSS), "contain" fits inside it.
+NEWSLETTER_IMAGES = {
+    "headshot": (HEADSHOT_PATH, (56, 56), "cover"),
+    "logo": (LOGO_PATH, (200, 48), "contain"),
+}
 
 # --- Output ---
 OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "output")
+
+# --- Local state (caches, stores) ---
+DATA_DIR = os.environ.get(
+    "MASH_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+)
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+FEED_CACHE_PATH = os.path.join(CACHE_DIR, "feeds.json")
+# Compiled Jinja template bytecode and minified/inlined template source, one
+# file per template and variant (replaced when the template changes)
+TEMPLATE_CACHE_DIR = os.path.join(CACHE_DIR, "templates")
+# Resized branding images, named by a hash of source bytes and target size
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, "images")
+# Collected items, delivered issues and per-source fetch watermarks
+ITEM_STORE_PATH = os.path.join(DATA_DIR, "items.sqlite3")
+# Last slot each scheduled job ran for (missed-run catch-up)
+SCHEDULER_STATE_PATH = os.path.join(DATA_DIR, "scheduler.json")
+# Built messages awaiting delivery (.eml) and their per-recipient state (.json)
+OUTBOX_DIR = os.path.join(DATA_DIR, "outbox")
+
+# --- Outbox retries ---
+# A failed recipient is retried after OUTBOX_RETRY_BASE_SECONDS, doubling up
+# to OUTBOX_RETRY_MAX_SECONDS, for at most OUTBOX_MAX_ATTEMPTS attempts. A run
+# waits up to OUTBOX_RUN_WAIT_SECONDS for its own issue's retries before
+# leaving the rest for `run.py --flush-outbox`, which waits up to
+# OUTBOX_FLUSH_WAIT_SECONDS (and also resends exhausted messages).
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_BASE_SECONDS = 30
+OUTBOX_RETRY_MAX_SECONDS = 3600
+OUTBOX_FLUSH_WAIT_SECONDS = 600
+OUTBOX_RUN_WAIT_SECONDS = 120
+
+# --- HTTP response cache ---
+# Shared by the PubMed, ClinicalTrials.gov and RSS fetchers. A TTL of 0
+# disables caching for that source. Replay mode serves only from the cache.
+HTTP_CACHE_PATH = os.path.join(CACHE_DIR, "http.sqlite3")
+HTTP_CACHE_MAX_BYTES = 200 * 1024 * 1024
+HTTP_CACHE_TTLS = {
+    "pubmed": 6 * 3600,
+    "ctgov": 6 * 3600,
+    "rss": 30 * 60,
+}
+HTTP_REPLAY = os.environ.get("MASH_REPLAY", "") == "1"
@@ -0,0 +1,248 @@
+"""
+Synthetic corpora for offline runs, fixture servers and benchmarks.
+
+Items are derived from the curated content in web_search_fetcher so they
+look like real MASH coverage, mixed with off-topic and preclinical items so
+the relevance filters have something to reject. Generation is deterministic
+for a given seed.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Optional
+from xml.sax.saxutils import escape
+
+from src.web_search_fetcher import get_curated_news, get_curated_publications, get_curated_trials
+
+_OFF_TOPIC_TITLES = [
+    "Obesity drug sales climb as supply constraints ease",
+    "Oncology biotech raises Series B to advance ADC platform",
+    "FDA clears new continuous glucose monitor for type 2 diabetes",
+    "Cardiology outcomes trial misses primary endpoint",
+    "Gene therapy maker trims workforce after pipeline review",
+]
+_PRECLINICAL_SUFFIXES = [
+    " in a mouse model",
+    " in murine hepatocytes",
+    ": an in vitro cell line study",
+]
+_JOURNALS = ["Hepatology", "Journal of Hepatology", "Gastroenterology", "Lancet Gastroenterol Hepatol"]
+_LAST_NAMES = ["Sanyal", "Loomba", "Harrison", "Newsome", "Ratziu", "Francque", "Younossi", "Rinella"]
+_PUB_TYPES = [
+    ["Randomized Controlled Trial", "Journal Article"],
+    ["Clinical Trial, Phase III", "Journal Article"],
+    ["Meta-Analysis", "Systematic Review"],
+    ["Review", "Journal Article"],
+    ["Case Reports"],
+]
+_STATUSES = ["RECRUITING", "ACTIVE_NOT_RECRUITING", "COMPLETED", "NOT_YET_RECRUITING"]
+_PHASES = [["PHASE2"], ["PHASE3"], ["PHASE2", "PHASE3"], ["PHASE4"], ["PHASE1"]]
+_MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def _variant_title(rng: random.Random, title: str, i: int) -> str:
+    """Return a title that is relevant, off-topic or preclinical, in a 70/15/15 mix."""
+    roll = rng.random()
+    if roll < 0.15:
+        return f"{rng.choice(_OFF_TOPIC_TITLES)} ({i})"
+    if roll < 0.30:
+        return f"{title}{rng.choice(_PRECLINICAL_SUFFIXES)} ({i})"
+    return f"{title} ({i})"
+
+
+def _recent(rng: random.Random, now: datetime, spread_days: int) -> datetime:
+    return now - timedelta(seconds=rng.randrange(spread_days * 86400))
+
+
+def generate_news(n: int, seed: int = 0, now: Optional[datetime] = None, spread_days: int = 14) -> list[dict]:
+    """Generate n news items shaped like fetch_rss_feed output, plus a `published` datetime."""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    base = get_curated_news()
+    items = []
+    for i in range(n):
+        src = base[i % len(base)]
+        published = _recent(rng, now, spread_days)
+        items.append({
+            "title": _variant_title(rng, src["title"], i),
+            "link": f"{src['link'].rstrip('/')}/{i}",
+            "description": f"<p>{escape(src['description'])}</p>",
+            "date": published.strftime("%Y-%m-%d"),
+            "published": published,
+            "source": src["source"],
+            "type": "industry_news",
+        })
+    items.sort(key=lambda x: x["published"], reverse=True)
+    return items
+
+
+def generate_publications(n: int, seed: int = 0, now: Optional[datetime] = None, spread_days: int = 14) -> list[dict]:
+    """Generate n PubMed records with the fields efetch returns."""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    base = get_curated_publications()
+    records = []
+    for i in range(n):
+        src = base[i % len(base)]
+        published = _recent(rng, now, spread_days)
+        records.append({
+            "pmid": str(40000000 + i),
+            "title": _variant_title(rng, src["title"], i),
+            "abstract": [src["description"]] * rng.randint(1, 3),
+            "journal": rng.choice(_JOURNALS),
+            "year": str(published.year),
+            "month": _MONTHS[published.month - 1],
+            "day": str(published.day),
+            # Indexed up to three days after publication
+            "added": min(published + timedelta(days=i % 4), now),
+            "authors": [
+                (rng.choice(_LAST_NAMES), rng.choice("ABCDEFGH") + rng.choice(["", "J", "M"]))
+                for _ in range(rng.randint(1, 8))
+            ],
+            "pub_types": rng.choice(_PUB_TYPES),
+        })
+    return records
+
+
+def generate_trials(n: int, seed: int = 0, now: Optional[datetime] = None, spread_days: int = 14) -> list[dict]:
+    """Generate n ClinicalTrials.gov v2 study records."""
+    rng = random.Random(seed)
+    now = now or datetime.now(timezone.utc)
+    base = get_curated_trials()
+    studies = []
+    for i in range(n):
+        src = base[i % len(base)]
+        updated = _recent(rng, now, spread_days)
+        studies.append({
+            "protocolSection": {
+                "identificationModule": {
+                    "nctId": f"NCT{7000000 + i:08d}",
+                    "briefTitle": _variant_title(rng, src["title"], i),
+                },
+                "statusModule": {
+                    "overallStatus": rng.choice(_STATUSES),
+                    "startDateStruct": {"date": "2025-06"},
+                    "lastUpdatePostDateStruct": {"date": updated.strftime("%Y-%m-%d")},
+                },
+                "sponsorCollaboratorsModule": {"leadSponsor": {"name": src["sponsor"]}},
+                "descriptionModule": {"briefSummary": src["description"]},
+                "designModule": {"phases": rng.choice(_PHASES)},
+                "conditionsModule": {"conditions": src["conditions"]},
+                "armsInterventionsModule": {
+                    "interventions": [{"name": name} for name in src["interventions"]]
+                },
+            }
+        })
+    studies.sort(
+        key=lambda s: s["protocolSection"]["statusModule"]["lastUpdatePostDateStruct"]["date"],
+        reverse=True,
+    )
+    return studies
+
+
+def rss_xml(items: list[dict], title: str = "Synthetic Feed") -> bytes:
+    """Serialize news items as an RSS 2.0 document."""
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<rss version="2.0"><channel>',
+        f"<title>{escape(title)}</title>",
+    ]
+    for item in items:
+        parts.append(
+            "<item>"
+            f"<title>{escape(item['title'])}</title>"
+            f"<link>{escape(item['link'])}</link>"
+            f"<description>{escape(item['description'])}</description>"
+            f"<pubDate>{format_datetime(item['published'])}</pubDate>"
+            "</item>"
+        )
+    parts.append("</channel></rss>")
+    return "".join(parts).encode("utf-8")
+
+
+def atom_xml(items: list[dict], title: str = "Synthetic Feed") -> bytes:
+    """Serialize news items as an Atom 1.0 document."""
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<feed xmlns="http://www.w3.org/2005/Atom">',
+        f"<title>{escape(title)}</title>",
+    ]
+    for item in items:
+        parts.append(
+            "<entry>"
+            f"<title>{escape(item['title'])}</title>"
+            f'<link href="{escape(item["link"], {chr(34): "&quot;"})}"/>'
+            f'<summary type="html">{escape(item["description"])}</summary>'
+            f"<published>{item['published'].isoformat()}</published>"
+            "</entry>"
+        )
+    parts.append("</feed>")
+    return "".join(parts).encode("utf-8")
+
+
+def efetch_xml(records: list[dict]) -> bytes:
+    """Serialize PubMed records as an efetch PubmedArticleSet document."""
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>', "<PubmedArticleSet>"]
+    for rec in records:
+        abstract = "".join(
+            f'<AbstractText Label="PART{j}">{escape(text)}</AbstractText>'
+            for j, text in enumerate(rec["abstract"])
+        )
+        authors = "".join(
+            f"<Author><LastName>{escape(last)}</LastName>"
+            + (f"<Initials>{escape(init)}</Initials>" if init else "")
+            + "</Author>"
+            for last, init in rec["authors"]
+        )
+        pub_types = "".join(
+            f"<PublicationType>{escape(pt)}</PublicationType>" for pt in rec["pub_types"]
+        )
+        parts.append(
+            "<PubmedArticle><MedlineCitation>"
+            f'<PMID Version="1">{rec["pmid"]}</PMID>'
+            "<Article><Journal><JournalIssue><PubDate>"
+            f"<Year>{rec['year']}</Year><Month>{rec['month']}</Month><Day>{rec['day']}</Day>"
+            "</PubDate></JournalIssue>"
+            f"<Title>{escape(rec['journal'])}</Title></Journal>"
+            f"<ArticleTitle>{escape(rec['title'])}</ArticleTitle>"
+            f"<Abstract>{abstract}</Abstract>"
+            f'<AuthorList CompleteYN="Y">{authors}</AuthorList>'
+            f"<PublicationTypeList>{pub_types}</PublicationTypeList>"
+            "</Article></MedlineCitation>"
+            "<PubmedData><History>"
+            '<PubMedPubDate PubStatus="entrez">'
+            f"<Year>{rec['added'].year}</Year><Month>{rec['added'].month}</Month><Day>{rec['added'].day}</Day>"
+            "</PubMedPubDate></History><ArticleIdList>"
+            f'<ArticleId IdType="pubmed">{rec["pmid"]}</ArticleId>'
+            "</ArticleIdList></PubmedData>"
+            "</PubmedArticle>"
+        )
+    parts.append("</PubmedArticleSet>")
+    return "".join(parts).encode("utf-8")
+
+
+def project_study(study: dict) -> dict:
+    """Reduce a study record to the fields of a minimal (NCTId, status, phase, sponsor) request."""
+    proto = study["protocolSection"]
+    status = proto["statusModule"]
+    return {
+        "protocolSection": {
+            "identificationModule": {"nctId": proto["identificationModule"]["nctId"]},
+            "statusModule": {
+                "overallStatus": status["overallStatus"],
+                "lastUpdatePostDateStruct": status["lastUpdatePostDateStruct"],
+            },
+            "sponsorCollaboratorsModule": proto["sponsorCollaboratorsModule"],
+            "designModule": proto["designModule"],
+        }
+    }
+
+
+def studies_json(studies: list[dict], next_page_token: Optional[str] = None) -> bytes:
+    """Serialize v2 study records as one /api/v2/studies response page."""
+    page = {"studies": studies}
+    if next_page_token:
+        page["nextPageToken"] = next_page_token
+    return json.dumps(page).encode("utf-8")
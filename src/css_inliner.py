@@ -0,0 +1,257 @@
+"""
+CSS inlining and HTML minification for email templates.
+
+Works on Jinja template *source*, so it runs once per template change rather
+than once per issue: every start tag in the template, including the ones
+inside {% for %} loops, gets the declarations of the stylesheet rules that
+match it as a style attribute, in cascade order (specificity, then source
+order), with any existing inline style taking precedence.
+
+Rules that cannot be resolved statically stay in the <style> block:
+pseudo-classes and pseudo-elements (:hover, ::before, :last-child), @media
+queries, the universal selector, and rules matching no element in the source
+(e.g. classes set from a template expression, like the trial status badge).
+Their declarations are marked !important so they still override the inlined
+values, as they would have in the stylesheet.
+
+Only the selector subset used by our templates is understood: type, class
+and id selectors, compounds of those, and descendant/child combinators.
+"""
+
+import re
+from typing import Optional
+
+_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+_HTML_COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.S)
+_STYLE_BLOCK_RE = re.compile(r"<style[^>]*>(.*?)</style>", re.S | re.I)
+_TAG_RE = re.compile(r"""<(/?)([a-zA-Z][\w-]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""")
+_ATTR_RE = re.compile(r"""\s([\w-]+)\s*=\s*("[^"]*"|'[^']*')""")
+_COMPOUND_RE = re.compile(r"^(?P<tag>[a-zA-Z][\w-]*)?(?P<rest>(?:[.#][\w-]+)*)$")
+_VOID_TAGS = frozenset("area base br col embed hr img input link meta source track wbr".split())
+_JINJA_RE = re.compile(r"\{\{.*?\}\}|\{%.*?%\}", re.S)
+_PRESERVE_RE = re.compile(r"(<(pre|textarea|script)\b.*?</\2>)", re.S | re.I)
+
+
+class _Rule:
+    __slots__ = ("selector", "compounds", "specificity", "order", "declarations")
+
+    def __init__(self, selector: str, compounds: list, specificity: tuple, order: int, declarations: list):
+        self.selector = selector
+        self.compounds = compounds
+        self.specificity = specificity
+        self.order = order
+        self.declarations = declarations
+
+
+def _declarations(body: str) -> list[tuple[str, str]]:
+    """Parse "a: b; c: d" into [(a, b), (c, d)]."""
+    decls = []
+    for part in body.split(";"):
+        name, sep, value = part.partition(":")
+        if sep and name.strip() and value.strip():
+            decls.append((name.strip().lower(), " ".join(value.split())))
+    return decls
+
+
+def _blocks(css: str) -> list[tuple[str, str]]:
+    """Split a stylesheet into top-level (prelude, body) blocks, keeping @media bodies whole."""
+    blocks = []
+    pos = 0
+    while True:
+        start = css.find("{", pos)
+        if start < 0:
+            break
+        depth = 1
+        i = start + 1
+        while depth and i < len(css):
+            if css[i] == "{":
+                depth += 1
+            elif css[i] == "}":
+                depth -= 1
+            i += 1
+        blocks.append((css[pos:start].strip(), css[start + 1:i - 1]))
+        pos = i
+    return blocks
+
+
+def _parse_selector(selector: str) -> Optional[tuple[list, tuple]]:
+    """Parse a selector into [(combinator, tag, classes, id)] and its specificity; None if unsupported."""
+    tokens = selector.replace(">", " > ").split()
+    compounds = []
+    combinator = " "
+    ids = classes = tags = 0
+    for token in tokens:
+        if token == ">":
+            combinator = ">"
+            continue
+        match = _COMPOUND_RE.match(token)
+        if not match or not token:
+            return None
+        tag = (match.group("tag") or "").lower()
+        rest = match.group("rest")
+        class_names = frozenset(re.findall(r"\.([\w-]+)", rest))
+        id_names = re.findall(r"#([\w-]+)", rest)
+        ids += len(id_names)
+        classes += len(class_names)
+        tags += 1 if tag else 0
+        compounds.append((combinator, tag, class_names, id_names[0] if id_names else None))
+        combinator = " "
+    if not compounds:
+        return None
+    return compounds, (ids, classes, tags)
+
+
+def _compound_matches(compound: tuple, element: tuple) -> bool:
+    _, tag, class_names, id_name = compound
+    el_tag, el_classes, el_id = element
+    return (not tag or tag == el_tag) and class_names <= el_classes and (id_name is None or id_name == el_id)
+
+
+def _matches(compounds: list, stack: list) -> bool:
+    """Match a parsed selector against the current element (stack[-1]) and its ancestors."""
+    def match_from(ci: int, ei: int) -> bool:
+        if not _compound_matches(compounds[ci], stack[ei]):
+            return False
+        if ci == 0:
+            return True
+        if compounds[ci][0] == ">":
+            return ei > 0 and match_from(ci - 1, ei - 1)
+        return any(match_from(ci - 1, ej) for ej in range(ei - 1, -1, -1))
+
+    return match_from(len(compounds) - 1, len(stack) - 1)
+
+
+def _format_rule(selector: str, declarations: list, important: bool = False) -> str:
+    suffix = " !important" if important else ""
+    body = ";".join(
+        f"{name}:{value}{suffix if not value.endswith('!important') else ''}" for name, value in declarations
+    )
+    return f"{selector}{{{body}}}"
+
+
+def _merge_style(existing: str, inlined: list[tuple[str, str]]) -> str:
+    """Combine inlined declarations with an element's own style attribute, which wins."""
+    merged = dict(inlined)
+    for name, value in _declarations(existing):
+        merged.pop(name, None)
+        merged[name] = value
+    return ";".join(f"{name}:{value}" for name, value in merged.items()).replace('"', "&quot;")
+
+
+def _rewrite_tag(name: str, attrs: str, style: str, classes: Optional[list[str]]) -> str:
+    """Rebuild a start tag with a new style attribute and (unless None) class list."""
+    for attr, value in (("style", style), ("class", None if classes is None else " ".join(classes))):
+        if value is None:
+            continue
+        existing = re.search(rf"""\s{attr}\s*=\s*("[^"]*"|'[^']*')""", attrs)
+        replacement = f' {attr}="{value}"' if value else ""
+        if existing:
+            attrs = f"{attrs[:existing.start()]}{replacement}{attrs[existing.end():]}"
+        else:
+            self_closing = attrs.rstrip().endswith("/")
+            base = attrs.rstrip()[:-1].rstrip() if self_closing else attrs.rstrip()
+            attrs = f'{base}{replacement}{" /" if self_closing else ""}'
+    return f"<{name}{attrs}>"
+
+
+def inline_css(source: str) -> str:
+    """Inline the <style> rules of an HTML (or Jinja template) source into style attributes."""
+    style_match = _STYLE_BLOCK_RE.search(source)
+    if not style_match:
+        return source
+    css = _COMMENT_RE.sub("", style_match.group(1))
+
+    rules = []
+    kept = []  # (selector or @-prelude, declarations or block body, mark !important)
+    for order, (prelude, body) in enumerate(_blocks(css)):
+        if prelude.startswith("@"):
+            kept.append((prelude, body, True))
+            continue
+        declarations = _declarations(body)
+        for selector in prelude.split(","):
+            selector = selector.strip()
+            parsed = _parse_selector(selector) if selector != "*" else None
+            if parsed is None:
+                kept.append((selector, declarations, selector != "*"))
+            else:
+                rules.append(_Rule(selector, parsed[0], parsed[1], order, declarations))
+
+    # Pass 1: find the rules matching each start tag.
+    tags = []  # (match, attribute values, static class tokens, matched rules)
+    used = set()
+    stack = []
+    for match in _TAG_RE.finditer(source, style_match.end()):
+        closing, tag, attrs = match.group(1) == "/", match.group(2).lower(), match.group(3)
+        if closing:
+            for depth in range(len(stack) - 1, -1, -1):
+                if stack[depth][0] == tag:
+                    del stack[depth:]
+                    break
+            continue
+
+        attr_values = {name.lower(): value[1:-1] for name, value in _ATTR_RE.findall(attrs)}
+        class_attr = attr_values.get("class", "")
+        class_tokens = _JINJA_RE.sub(" ", class_attr).split()
+        stack.append((tag, frozenset(class_tokens), attr_values.get("id")))
+        matched = [rule for rule in rules if _matches(rule.compounds, stack)]
+        if tag in _VOID_TAGS or attrs.rstrip().endswith("/"):
+            stack.pop()
+        if matched:
+            used.update(rule.selector for rule in matched)
+            tags.append((match, attr_values, class_tokens, matched))
+
+    # Rules that matched nothing may target classes set by template expressions.
+    kept.extend((rule.selector, rule.declarations, True) for rule in rules if rule.selector not in used)
+
+    remaining = []
+    for selector, body, important in kept:
+        if selector.startswith("@"):
+            inner = "".join(
+                _format_rule(" ".join(sel.split()), _declarations(rule_body), important)
+                for sel, rule_body in _blocks(body)
+            )
+            remaining.append(f"{' '.join(selector.split())}{{{inner}}}")
+        else:
+            remaining.append(_format_rule(selector, body, important))
+    style_block = f"<style>{''.join(remaining)}</style>" if remaining else ""
+    # Only classes the kept rules refer to are still needed in the markup.
+    needed_classes = set(re.findall(r"\.([\w-]+)", style_block))
+
+    # Pass 2: rewrite the matched start tags.
+    out = [source[:style_match.start()], style_block]
+    pos = style_match.end()
+    for match, attr_values, class_tokens, matched in tags:
+        matched.sort(key=lambda r: (r.specificity, r.order))
+        inlined = [decl for rule in matched for decl in rule.declarations]
+        style = _merge_style(attr_values.get("style", ""), inlined)
+        # Template expressions in the class attribute are kept as they are.
+        classes = [t for t in class_tokens if t in needed_classes]
+        classes += _JINJA_RE.findall(attr_values.get("class", ""))
+        out.append(source[pos:match.start()])
+        out.append(_rewrite_tag(match.group(2), match.group(3), style, classes if "class" in attr_values else None))
+        pos = match.end()
+    out.append(source[pos:])
+    return "".join(out)
+
+
+def _collapse(match: re.Match) -> str:
+    return "\n" if "\n" in match.group() else " "
+
+
+def minify_html(source: str) -> str:
+    """
+    Drop comments and collapse whitespace runs outside pre/textarea/script.
+
+    A run containing a line break becomes a single newline rather than a
+    space, which renders the same but keeps lines short for the email's
+    transfer encoding.
+    """
+    parts = _PRESERVE_RE.split(source)
+    result = []
+    # re.split with two groups yields [text, block, tag name, text, ...]
+    for i in range(0, len(parts), 3):
+        text = _HTML_COMMENT_RE.sub("", parts[i])
+        result.append(re.sub(r"\s+", _collapse, text))
+        if i + 1 < len(parts):
+            result.append(parts[i + 1])
+    return "".join(result).strip()
@@ -0,0 +1,140 @@
+"""
+Date normalization shared by the fetchers.
+
+Feeds use RFC 822 or ISO 8601, PubMed uses "2025 Jan 3" style Year/Month/Day
+or free-text MedlineDate ("2024 Nov-Dec", "2025 Spring"), ClinicalTrials.gov
+uses "2025-06-12" or "2025-06". Each has a cheap dedicated parser; dateutil
+is only imported for strings none of them understand. Results are memoized,
+since the same dates recur across feeds, pages and runs.
+"""
+
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+_MONTHS = {
+    name: i for i, name in enumerate(
+        ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1
+    )
+}
+_SEASONS = {"spring": 3, "summer": 6, "fall": 9, "autumn": 9, "winter": 12}
+# Year, then an optional month (name, season or number) and day. Anything
+# after that ("-Dec", "-2025 Jan") is a MedlineDate range; its start is used.
+_YMD_RE = re.compile(r"(\d{4})(?:[ /-]([A-Za-z]+|\d{1,2})(?:[ /-](\d{1,2})(?!\d))?)?")
+
+
+def _parse_iso(value: str) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _parse_ymd(value: str) -> Optional[datetime]:
+    match = _YMD_RE.match(value)
+    if not match:
+        return None
+    year, month, day = match.groups()
+    if month is None:
+        month_num = 1
+    elif month.isdigit():
+        month_num = int(month)
+    else:
+        month = month.lower()
+        month_num = _MONTHS.get(month[:3]) or _SEASONS.get(month)
+        if month_num is None:
+            return None
+    try:
+        return datetime(int(year), month_num, int(day) if day else 1)
+    except ValueError:
+        return None
+
+
+def _parse_rfc822(value: str) -> Optional[datetime]:
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _parse_fallback(value: str) -> Optional[datetime]:
+    from dateutil import parser as dateparser
+
+    try:
+        return dateparser.parse(value)
+    except (ValueError, OverflowError):
+        logger.debug("Unparseable date %r", value)
+        return None
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value: str) -> Optional[datetime]:
+    """Parse a feed, PubMed or ClinicalTrials.gov date; naive results are taken as UTC."""
+    value = value.strip()
+    if not value or value == "Unknown":
+        return None
+    if value[:4].isdigit():
+        dt = _parse_iso(value) or _parse_ymd(value)
+    else:
+        dt = _parse_rfc822(value)
+    if dt is None:
+        dt = _parse_fallback(value)
+    if dt is not None and dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _month_num(month: str) -> Optional[int]:
+    if month.isdigit():
+        return int(month)
+    return _MONTHS.get(month[:3].lower()) or _SEASONS.get(month.lower())
+
+
+@lru_cache(maxsize=4096)
+def period_end(value: str) -> Optional[datetime]:
+    """
+    The last second of the period a coarse PubMed or ClinicalTrials.gov date
+    names: "2025" -> Dec 31, "2025 Oct" or "2025-10" -> Oct 31, "2025 Sep-Oct"
+    -> Oct 31, "2025 Spring" -> May 31 (UTC). None for dates with a day and
+    for anything else.
+    """
+    value = value.strip()
+    match = _YMD_RE.match(value)
+    if not match or match.group(3) or not value[:4].isdigit():
+        return None
+    year, month = int(match.group(1)), match.group(2)
+    rest = value[match.end():].strip()
+    if rest.startswith("-"):
+        rest = rest[1:].strip()
+        if rest[:4].isdigit():  # "2024 Dec-2025 Jan"
+            return period_end(rest)
+        if rest:  # "2025 Sep-Oct"
+            month = rest.split()[0]
+
+    if month is None:
+        first_after = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+    else:
+        month_num = _month_num(month)
+        if month_num is None or not 1 <= month_num <= 12:
+            return None
+        if month.lower() in _SEASONS:
+            month_num += 2
+        year += month_num // 12
+        first_after = datetime(year, month_num % 12 + 1, 1, tzinfo=timezone.utc)
+    return first_after - timedelta(seconds=1)
+
+
+def to_timestamp(value: str, end: bool = False) -> float:
+    """
+    Epoch seconds for a date string, or 0.0 if it can't be parsed (sorts last).
+
+    A year, month or season is taken as its first day, or with `end` as its
+    last second (see period_end).
+    """
+    dt = (period_end(value) if end else None) or parse_date(value)
+    return dt.timestamp() if dt else 0.0
@@ -0,0 +1,157 @@
+"""Near-duplicate clustering across news, publications and trials (MinHash + LSH)."""
+
+import hashlib
+import logging
+import re
+import struct
+from collections import defaultdict
+
+from src.config import DEDUP_SIMILARITY, DEDUP_BANDS, DEDUP_ROWS, DEDUP_TYPE_PRIORITY
+
+logger = logging.getLogger(__name__)
+
+_STOPWORDS = frozenset(
+    "a an and as at by for from in into is of on or the to with vs via its their after new".split()
+)
+_NUM_HASHES = DEDUP_BANDS * DEDUP_ROWS
+# One SHAKE-128 digest per shingle supplies all of its 32-bit hash values.
+_HASH_ROW = struct.Struct(f"<{_NUM_HASHES}I")
+
+
+def _shingles(title: str) -> set[str]:
+    """Word unigrams and bigrams of a title, minus stopwords."""
+    words = [w for w in re.split(r"\W+", title.lower()) if w and w not in _STOPWORDS]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def _minhash(shingles: set[str], rows: dict) -> list[int]:
+    """MinHash signature of a shingle set; `rows` memoizes per-shingle hash rows."""
+    hashed = []
+    for shingle in shingles:
+        row = rows.get(shingle)
+        if row is None:
+            digest = hashlib.shake_128(shingle.encode("utf-8")).digest(_HASH_ROW.size)
+            row = rows[shingle] = _HASH_ROW.unpack(digest)
+        hashed.append(row)
+    return list(map(min, zip(*hashed)))
+
+
+def _primary_id(item: dict) -> str:
+    """Identifier of a primary record (trial or publication); news has none."""
+    if item.get("type") == "clinical_trial":
+        return item.get("nct_id") or item.get("link", "")
+    if item.get("type") == "publication":
+        return item.get("link", "")
+    return ""
+
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _rank(item: dict) -> tuple:
+    """Sort key for picking a cluster's representative: primary sources first, then detail."""
+    try:
+        priority = DEDUP_TYPE_PRIORITY.index(item.get("type", ""))
+    except ValueError:
+        priority = len(DEDUP_TYPE_PRIORITY)
+    return priority, -len(item.get("description") or "")
+
+
+def cluster_near_duplicates(items: list[dict]) -> list[list[int]]:
+    """
+    Group items whose titles are near-duplicates; return clusters as index lists.
+
+    Each title is reduced to a MinHash signature, and signatures are bucketed
+    by LSH bands, so only items sharing a band are ever compared. Candidate
+    pairs are confirmed with exact Jaccard similarity >= DEDUP_SIMILARITY.
+    """
+    shingles = [_shingles(item.get("title", "")) for item in items]
+    rows = {}
+    buckets = defaultdict(list)
+    for idx, sh in enumerate(shingles):
+        if not sh:
+            continue
+        sig = _minhash(sh, rows)
+        for band in range(DEDUP_BANDS):
+            key = (band, tuple(sig[band * DEDUP_ROWS:(band + 1) * DEDUP_ROWS]))
+            buckets[key].append(idx)
+
+    parent = list(range(len(items)))
+    # A cluster may hold at most one primary record: two different trials or
+    # papers are never duplicates of each other, however alike the titles.
+    primary = [_primary_id(item) for item in items]
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Within a bucket, compare each item against one leader per cluster seen
+    # so far rather than against every member, keeping dense buckets linear.
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        leaders = []
+        for idx in members:
+            for leader in leaders:
+                a, b = find(leader), find(idx)
+                if a == b:
+                    break
+                if primary[a] and primary[b]:
+                    continue
+                if _jaccard(shingles[leader], shingles[idx]) >= DEDUP_SIMILARITY:
+                    parent[b] = a
+                    primary[a] = primary[a] or primary[b]
+                    break
+            else:
+                leaders.append(idx)
+
+    clusters = defaultdict(list)
+    for idx in range(len(items)):
+        clusters[find(idx)].append(idx)
+    return list(clusters.values())
+
+
+def deduplicate_sources(
+    news: list[dict], publications: list[dict], trials: list[dict]
+) -> tuple[list[dict], list[dict], list[dict]]:
+    """
+    Collapse near-duplicate items across all three sections.
+
+    The best item of each cluster is kept in its own section (primary
+    sources before news, then the most detailed), and the others are
+    attached to it as `also_covered_by` links. Section order is preserved.
+    """
+    items = news + publications + trials
+    keep = [True] * len(items)
+    merged = 0
+    for cluster in cluster_near_duplicates(items):
+        if len(cluster) < 2:
+            continue
+        best = min(cluster, key=lambda i: _rank(items[i]))
+        rep = dict(items[best])
+        related = list(rep.get("also_covered_by", []))
+        for idx in cluster:
+            if idx == best:
+                continue
+            keep[idx] = False
+            merged += 1
+            other = items[idx]
+            related.append({"source": other.get("source", ""), "link": other.get("link", ""), "title": other.get("title", "")})
+            related.extend(other.get("also_covered_by", []))
+        rep["also_covered_by"] = related
+        items[best] = rep
+        logger.info("Merged %d near-duplicates into %r", len(cluster) - 1, rep.get("title", "")[:80])
+
+    if merged:
+        logger.info("Near-duplicate clustering removed %d of %d items", merged, len(items))
+    offset = 0
+    result = []
+    for section in (news, publications, trials):
+        result.append([items[i] for i in range(offset, offset + len(section)) if keep[i]])
+        offset += len(section)
+    return result[0], result[1], result[2]
@@ -1,53 +1,70 @@
-"""Email sending module for the MASH Newsletter."""
+"""
+Email sending module for the MASH Newsletter.
+
+send_bulk() delivers one issue to a distribution list, and deliver() does
+the same for a message already built and serialized (e.g. by src.outbox).
+The message is serialized once; each recipient's copy only differs in its
+To header.
+Copies go out over a small pool of authenticated SMTP connections that are
+reused across messages (one STARTTLS + login per connection, not per
+recipient), paced by a token bucket to stay within the provider's per-minute
+send limit.
+"""
 
 from __future__ import annotations
 
 import logging
+import os
 import re
 import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from email.message import EmailMessage
+from email.policy import SMTP as SMTP_POLICY
 from datetime import datetime, timezone
+from typing import Iterator, NamedTuple
 
 from src.config import (
     SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD,
-    SENDER_EMAIL, RECIPIENT_EMAIL,
+    SENDER_EMAIL, RECIPIENT_EMAIL, EMAIL_CLIP_BYTES,
+    SMTP_POOL_SIZE, SMTP_SENDS_PER_MINUTE, SMTP_MESSAGES_PER_CONNECTION,
 )
+from src.images import NewsletterImage, newsletter_images
+from src.instrumentation import bound, count, span
+from src.rate_limiter import TokenBucket
 
 logger = logging.getLogger(__name__)
 
 
+AUTH_FAILED = "Authentication failed"
+
+
+class DeliveryResult(NamedTuple):
+    recipient: str
+    sent: bool
+    error: str = ""
+    permanent: bool = False  # rejected by the server (5xx); resending will not help
+
+
 def _clean(text: str) -> str:
     """Replace non-breaking spaces and other common non-ASCII whitespace."""
     return re.sub(r"[\xa0\u200b\u200c\u200d\ufeff]", " ", text)
 
 
-def send_newsletter(
+def build_message(
     html_content: str,
     plain_text: str,
-    recipient: str = RECIPIENT_EMAIL,
     subject: str | None = None,
-) -> bool:
+    images: list[NewsletterImage] | None = None,
+) -> EmailMessage:
     """
-    Send the newsletter via SMTP.
+    Build the newsletter message, without a To header.
 
-    Returns True if sent successfully, False otherwise.
-    Requires SMTP_USER and SMTP_PASSWORD environment variables.
+    `images` are attached as inline multipart/related parts for the HTML's
+    cid: references.
     """
-    # Diagnostic logging so Actions logs show exactly what's missing
-    logger.info("SMTP_SERVER: %s", SMTP_SERVER)
-    logger.info("SMTP_PORT: %s", SMTP_PORT)
-    logger.info("SMTP_USER: %s", SMTP_USER[:3] + "***" if SMTP_USER else "<empty>")
-    logger.info("SMTP_PASSWORD: %s", "****" if SMTP_PASSWORD else "<empty>")
-    logger.info("SENDER_EMAIL: %s", SENDER_EMAIL or "<empty>")
-    logger.info("Recipient: %s", recipient)
-
-    if not SMTP_USER or not SMTP_PASSWORD:
-        logger.error(
-            "SMTP credentials not configured! Set SMTP_USER and SMTP_PASSWORD "
-            "as GitHub repository secrets. Newsletter saved to output/ but NOT emailed."
-        )
-        return False
-
     if subject is None:
         date_str = datetime.now(timezone.utc).strftime("%b %d, %Y")
         subject = f"MASH Weekly Intelligence - {date_str}"
@@ -57,41 +74,250 @@ def send_newsletter(
     # copy-pasted from web pages, or template rendering.
     html_content = _clean(html_content)
     plain_text = _clean(plain_text)
-    subject = _clean(subject)
-    smtp_user = _clean(SMTP_USER).strip()
-    smtp_pass = _clean(SMTP_PASSWORD)
-    sender = _clean(SENDER_EMAIL or SMTP_USER).strip()
-    recipient = _clean(recipient).strip()
 
     # Use modern EmailMessage API with UTF-8 support – avoids the compat32
     # policy's ASCII-only header serialisation that caused the \xa0 crash.
     msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = sender
-    msg["To"] = recipient
+    msg["Subject"] = _clean(subject)
+    msg["From"] = _clean(SENDER_EMAIL or SMTP_USER).strip()
     msg.set_content(plain_text, subtype="plain")
     msg.add_alternative(html_content, subtype="html")
+    if images:
+        html_part = msg.get_payload()[-1]
+        for image in images:
+            maintype, subtype = image.mime.split("/", 1)
+            with open(image.path, "rb") as f:
+                html_part.add_related(
+                    f.read(), maintype, subtype,
+                    cid=f"<{image.cid}>", filename=os.path.basename(image.path), disposition="inline",
+                )
+
+    html_bytes = len(html_content.encode("utf-8"))
+    if html_bytes > EMAIL_CLIP_BYTES:
+        logger.warning(
+            "HTML body exceeds %d bytes; Gmail will clip this message", EMAIL_CLIP_BYTES
+        )
+    return msg
+
+
+def serialize_message(msg: EmailMessage) -> bytes:
+    """Serialize a built message with CRLF line endings, as sent over SMTP."""
+    return msg.as_bytes(policy=SMTP_POLICY)
+
+
+def addressed_copy(payload: bytes, recipient: str) -> bytes:
+    """A serialized message (see build_message) with `recipient` as its To header."""
+    return f"To: {recipient}\r\n".encode("utf-8") + payload
+
+
+class SMTPPool:
+    """
+    Authenticated SMTP connections shared by delivery threads.
+
+    At most `size` connections are open at once. A connection goes back to
+    the pool after each message and is retired after `max_messages`, or
+    dropped if it failed mid-conversation. After an authentication failure
+    every further connection attempt fails immediately rather than logging
+    in again with the same bad credentials.
+    """
+
+    def __init__(self, size: int = SMTP_POOL_SIZE, max_messages: int = SMTP_MESSAGES_PER_CONNECTION):
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle: list[smtplib.SMTP] = []
+        self._sent: dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._max_messages = max_messages
+        self._auth_error: smtplib.SMTPAuthenticationError | None = None
+        self.connections = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._auth_error:
+            raise self._auth_error
+        with span("smtp", op="connect"):
+            server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30)
+            try:
+                server.ehlo()
+                server.starttls()
+                server.ehlo()
+                server.login(_clean(SMTP_USER).strip(), _clean(SMTP_PASSWORD))
+            except smtplib.SMTPAuthenticationError as e:
+                self._auth_error = e
+                _close(server)
+                raise
+            except Exception:
+                _close(server)
+                raise
+        with self._lock:
+            self.connections += 1
+        return server
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """Check out a connection for one message."""
+        with self._slots:
+            with self._lock:
+                server = self._idle.pop() if self._idle else None
+            if server is None:
+                server = self._connect()
+            try:
+                yield server
+            except smtplib.SMTPRecipientsRefused:
+                # Refused before DATA; the session is still usable.
+                self._release(server)
+                raise
+            except Exception:
+                self._discard(server)
+                raise
+            self._release(server)
+
+    def _release(self, server: smtplib.SMTP) -> None:
+        with self._lock:
+            count = self._sent.get(id(server), 0) + 1
+            if count < self._max_messages:
+                self._sent[id(server)] = count
+                self._idle.append(server)
+                return
+        self._discard(server, quit_=True)
+
+    def _discard(self, server: smtplib.SMTP, quit_: bool = False) -> None:
+        with self._lock:
+            self._sent.pop(id(server), None)
+        _close(server, quit_)
+
+    def close(self) -> None:
+        """Log out of every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._sent.clear()
+        for server in idle:
+            _close(server, quit_=True)
+
+
+def _close(server: smtplib.SMTP, quit_: bool = False) -> None:
+    try:
+        server.quit() if quit_ else server.close()
+    except Exception:
+        server.close()
+
 
+def _deliver(pool: SMTPPool, limiter: TokenBucket, payload: bytes, recipient: str) -> DeliveryResult:
+    """Send one recipient's copy, retrying once on a fresh connection if a pooled one went stale."""
+    envelope_from = _clean(SMTP_USER).strip()
+    limiter.acquire()
+    error = ""
+    for _ in range(2):
+        try:
+            with pool.connection() as server, span("smtp", op="sendmail"):
+                server.sendmail(envelope_from, [recipient], addressed_copy(payload, recipient))
+            return DeliveryResult(recipient, True)
+        except smtplib.SMTPServerDisconnected as e:
+            error = f"Disconnected: {e}"
+        except smtplib.SMTPAuthenticationError as e:
+            return DeliveryResult(recipient, False, f"{AUTH_FAILED}: {e}")
+        except smtplib.SMTPRecipientsRefused as e:
+            code, reason = e.recipients.get(recipient, (0, b""))
+            return DeliveryResult(
+                recipient, False, f"Refused ({code}): {reason.decode(errors='replace')}", permanent=code >= 500
+            )
+        except smtplib.SMTPDataError as e:
+            return DeliveryResult(recipient, False, str(e), permanent=e.smtp_code >= 500)
+        except smtplib.SMTPException as e:
+            return DeliveryResult(recipient, False, str(e))
+        except Exception as e:
+            return DeliveryResult(recipient, False, f"Unexpected error: {e}")
+    return DeliveryResult(recipient, False, error)
+
+
+def credentials_configured() -> bool:
+    return bool(SMTP_USER and SMTP_PASSWORD)
+
+
+def normalize_recipients(recipients: list[str]) -> list[str]:
+    """Cleaned, de-duplicated addresses, in order."""
+    return list(dict.fromkeys(_clean(r).strip() for r in recipients if r.strip()))
+
+
+def deliver(payload: bytes, recipients: list[str]) -> list[DeliveryResult]:
+    """
+    Send a serialized message (see serialize_message) to each recipient.
+
+    Returns a DeliveryResult per distinct recipient, in order. Requires
+    SMTP_USER and SMTP_PASSWORD environment variables.
+    """
+    recipients = normalize_recipients(recipients)
+
+    # Diagnostic logging so Actions logs show exactly what's missing
+    logger.info("SMTP_SERVER: %s", SMTP_SERVER)
+    logger.info("SMTP_PORT: %s", SMTP_PORT)
+    logger.info("SMTP_USER: %s", SMTP_USER[:3] + "***" if SMTP_USER else "<empty>")
+    logger.info("SMTP_PASSWORD: %s", "****" if SMTP_PASSWORD else "<empty>")
+    logger.info("SENDER_EMAIL: %s", SENDER_EMAIL or "<empty>")
+    logger.info("Recipients: %d, message size: %d bytes", len(recipients), len(payload))
+
+    if not credentials_configured():
+        logger.error(
+            "SMTP credentials not configured! Set SMTP_USER and SMTP_PASSWORD "
+            "as GitHub repository secrets. Newsletter saved to output/ but NOT emailed."
+        )
+        return [DeliveryResult(r, False, "SMTP credentials not configured") for r in recipients]
+
+    started = time.perf_counter()
+    pool = SMTPPool(size=min(SMTP_POOL_SIZE, len(recipients)) or 1)
+    limiter = TokenBucket(SMTP_SENDS_PER_MINUTE / 60, capacity=SMTP_POOL_SIZE)
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=30) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            server.login(smtp_user, smtp_pass)
-            server.sendmail(smtp_user, [recipient], msg.as_bytes())
-        logger.info("Newsletter emailed to %s", recipient)
-        return True
-    except smtplib.SMTPAuthenticationError as e:
+        with ThreadPoolExecutor(max_workers=SMTP_POOL_SIZE) as executor:
+            results = list(executor.map(bound(lambda r: _deliver(pool, limiter, payload, r)), recipients))
+    finally:
+        pool.close()
+
+    failed = [r for r in results if not r.sent]
+    count("send.delivered", len(results) - len(failed))
+    count("send.failed", len(failed))
+    count("send.bytes", len(payload) * (len(results) - len(failed)))
+    logger.info(
+        "Delivered %d/%d messages in %.1fs over %d SMTP connection(s)",
+        len(results) - len(failed), len(results), time.perf_counter() - started, pool.connections,
+    )
+    for result in failed:
+        logger.error("Failed to send to %s: %s", result.recipient, result.error)
+    if any(r.error.startswith(AUTH_FAILED) for r in failed):
         logger.error(
-            "SMTP authentication failed: %s. "
+            "SMTP authentication failed. "
             "If using Gmail, you need an App Password (not your regular password). "
-            "Go to https://myaccount.google.com/apppasswords to generate one.",
-            e,
+            "Go to https://myaccount.google.com/apppasswords to generate one."
         )
-        return False
-    except smtplib.SMTPException as e:
-        logger.error("Failed to send email: %s", e)
-        return False
-    except Exception as e:
-        logger.error("Unexpected error sending email: %s", e)
-        return False
+    return results
+
+
+def send_bulk(
+    html_content: str,
+    plain_text: str,
+    recipients: list[str],
+    subject: str | None = None,
+    images: list[NewsletterImage] | None = None,
+) -> list[DeliveryResult]:
+    """
+    Build the newsletter and send it to every address in `recipients`, one message each.
+
+    `images` defaults to the configured branding images (newsletter_images()),
+    which the rendered HTML references by cid:; pass [] to attach none.
+    """
+    if images is None:
+        images = newsletter_images()
+    msg = build_message(html_content, plain_text, subject, images)
+    return deliver(serialize_message(msg), recipients)
+
+
+def send_newsletter(
+    html_content: str,
+    plain_text: str,
+    recipient: str = RECIPIENT_EMAIL,
+    subject: str | None = None,
+    images: list[NewsletterImage] | None = None,
+) -> bool:
+    """
+    Send the newsletter (with the branding images by default, see send_bulk)
+    to a single recipient. Returns True if sent successfully.
+    """
+    results = send_bulk(html_content, plain_text, [recipient], subject, images)
+    return bool(results) and results[0].sent
@@ -0,0 +1,91 @@
+"""Persistent ETag / Last-Modified validator cache for RSS feeds."""
+
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from src.config import FEED_CACHE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class FeedCache:
+    """
+    On-disk cache of HTTP validators and parsed items, keyed by feed URL.
+
+    Each entry holds the validators from the last 200 response, the size of
+    that body, the articles it produced (with their parsed publish time) and
+    the settings they were filtered with, so a 304 can reuse them as-is.
+    """
+
+    def __init__(self, path: str = FEED_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Optional[dict] = None
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                logger.warning("Ignoring unreadable feed cache %s: %s", self.path, e)
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+
+    def get(self, url: str) -> Optional[dict]:
+        """Return the cached entry for a feed URL, if any."""
+        with self._lock:
+            return self._load().get(url)
+
+    def conditional_headers(self, entry: Optional[dict]) -> dict:
+        """Build If-None-Match / If-Modified-Since headers from an entry."""
+        headers = {}
+        if not entry:
+            return headers
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url: str, resp, items: list[dict], signature: str, cutoff: str) -> None:
+        """Record validators and parsed items from a full (200) response."""
+        with self._lock:
+            entries = self._load()
+            previous = entries.get(url, {})
+            entries[url] = {
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "body_bytes": len(resp.content),
+                "items": items,
+                "signature": signature,
+                "cutoff": cutoff,
+                "bytes_saved": previous.get("bytes_saved", 0),
+                "hits": previous.get("hits", 0),
+            }
+            self._save()
+
+    def record_hit(self, url: str) -> int:
+        """Count a 304 for a feed and return the bytes it saved."""
+        with self._lock:
+            entry = self._load()[url]
+            saved = entry.get("body_bytes", 0)
+            entry["bytes_saved"] = entry.get("bytes_saved", 0) + saved
+            entry["hits"] = entry.get("hits", 0) + 1
+            self._save()
+            return saved
+
+
+feed_cache = FeedCache()
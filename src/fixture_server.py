@@ -0,0 +1,221 @@
+"""
+Local stand-in for PubMed E-utilities, ClinicalTrials.gov and the RSS feeds.
+
+Serves synthetic corpora from src.corpus with configurable latency, error
+rate and corpus size, so the whole pipeline can be exercised, benchmarked
+and load-tested without internet access. Point the fetchers at it with
+MASH_FIXTURE_URL:
+
+    python -m src.fixture_server --port 8765 --corpus-size 500 --latency 0.05
+    MASH_FIXTURE_URL=http://127.0.0.1:8765 python run.py --dry-run
+
+Routes:
+    /entrez/eutils/esearch.fcgi   esearch (JSON, with usehistory/WebEnv)
+    /entrez/eutils/efetch.fcgi    efetch by id list or WebEnv/query_key (GET or POST)
+    /api/v2/studies               v2 studies search, paged with nextPageToken (filter.ids supported)
+    /feeds/<slug>                 RSS 2.0 or Atom, with ETag/Last-Modified
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from src import corpus
+from src.config import NEWS_FEEDS, feed_slug
+
+logger = logging.getLogger(__name__)
+
+
+class FixtureState:
+    """Corpora and server-side state (history-server result sets) shared by handlers."""
+
+    def __init__(self, corpus_size: int = 200, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.publications = corpus.generate_publications(corpus_size, seed=seed)
+        self.pub_index = {rec["pmid"]: rec for rec in self.publications}
+        self.studies = corpus.generate_trials(corpus_size, seed=seed)
+        self.feeds = {}
+        for i, feed in enumerate(NEWS_FEEDS):
+            items = corpus.generate_news(corpus_size, seed=seed + i)
+            fmt = corpus.atom_xml if i % 2 else corpus.rss_xml
+            body = fmt(items, feed["name"])
+            self.feeds[feed_slug(feed["name"])] = (body, hashlib.md5(body).hexdigest())
+        self.last_modified = formatdate(usegmt=True)
+        self.history: dict[str, list[list[str]]] = {}
+        self.lock = threading.Lock()
+
+    def search(self, term: str) -> list[str]:
+        """Return the PMIDs a term matches: a stable, term-dependent ~2/3 of the corpus."""
+        salt = hashlib.md5(term.encode("utf-8")).hexdigest()
+        return [
+            rec["pmid"] for rec in self.publications
+            if int(hashlib.md5((salt + rec["pmid"]).encode()).hexdigest(), 16) % 3
+        ]
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    state: FixtureState  # set on the per-server subclass
+
+    def log_message(self, fmt, *args):
+        logger.debug("%s - %s", self.address_string(), fmt % args)
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "text/plain", headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _params(self) -> dict:
+        parsed = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        if self.command == "POST":
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode("utf-8")
+            params.update({k: v[-1] for k, v in parse_qs(body).items()})
+        return params
+
+    def _handle(self):
+        state = self.state
+        if state.latency:
+            time.sleep(state.latency * (0.5 + state.rng.random()))
+        path = urlparse(self.path).path
+        if state.error_rate and state.rng.random() < state.error_rate:
+            if path.startswith("/entrez/"):
+                return self._send(429, b"rate limited", headers={"Retry-After": "0.1"})
+            return self._send(503, b"injected failure")
+
+        params = self._params()
+        if path == "/entrez/eutils/esearch.fcgi":
+            return self._esearch(params)
+        if path == "/entrez/eutils/efetch.fcgi":
+            return self._efetch(params)
+        if path == "/api/v2/studies":
+            return self._studies(params)
+        if path.startswith("/feeds/"):
+            return self._feed(path[len("/feeds/"):])
+        self._send(404, b"not found")
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def _esearch(self, params: dict):
+        state = self.state
+        term = params.get("term", "")
+        if term.startswith("#"):
+            # Combine earlier result sets of this WebEnv: "#1 OR #2 ..."
+            with state.lock:
+                sets = state.history.get(params.get("WebEnv", ""), [])
+                keys = [int(k.strip().lstrip("#")) for k in term.split("OR")]
+                ids = sorted({pmid for k in keys if 0 < k <= len(sets) for pmid in sets[k - 1]})
+        else:
+            ids = state.search(term)
+
+        result = {"count": str(len(ids))}
+        if params.get("usehistory") == "y":
+            with state.lock:
+                webenv = params.get("WebEnv") or f"MCID_{uuid.uuid4().hex}"
+                sets = state.history.setdefault(webenv, [])
+                sets.append(ids)
+                result.update(webenv=webenv, querykey=str(len(sets)))
+        retmax = int(params.get("retmax", 20))
+        result["idlist"] = ids[:retmax]
+        body = json.dumps({"esearchresult": result}).encode("utf-8")
+        self._send(200, body, "application/json")
+
+    def _efetch(self, params: dict):
+        state = self.state
+        if "WebEnv" in params:
+            with state.lock:
+                sets = state.history.get(params["WebEnv"], [])
+                key = int(params.get("query_key", 0))
+                ids = sets[key - 1] if 0 < key <= len(sets) else []
+            start = int(params.get("retstart", 0))
+            ids = ids[start:start + int(params.get("retmax", 20))]
+        else:
+            ids = [i for i in params.get("id", "").split(",") if i]
+        records = [state.pub_index[i] for i in ids if i in state.pub_index]
+        self._send(200, corpus.efetch_xml(records), "text/xml")
+
+    def _studies(self, params: dict):
+        studies = self.state.studies
+        if params.get("filter.ids"):
+            wanted = set(params["filter.ids"].replace("|", ",").split(","))
+            studies = [s for s in studies if s["protocolSection"]["identificationModule"]["nctId"] in wanted]
+        if "BriefTitle" not in params.get("fields", "BriefTitle"):
+            studies = [corpus.project_study(s) for s in studies]
+        size = int(params.get("pageSize", 10))
+        start = int(params.get("pageToken", 0) or 0)
+        page = studies[start:start + size]
+        token = str(start + size) if start + size < len(studies) else None
+        self._send(200, corpus.studies_json(page, token), "application/json")
+
+    def _feed(self, slug: str):
+        feed = self.state.feeds.get(slug)
+        if feed is None:
+            return self._send(404, b"unknown feed")
+        body, etag = feed
+        validators = {"ETag": f'"{etag}"', "Last-Modified": self.state.last_modified}
+        if self.headers.get("If-None-Match") == f'"{etag}"':
+            return self._send(304, headers=validators)
+        self._send(200, body, "application/xml", validators)
+
+
+def start_fixture_server(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    corpus_size: int = 200,
+    latency: float = 0.0,
+    error_rate: float = 0.0,
+    seed: int = 0,
+) -> tuple[ThreadingHTTPServer, str]:
+    """Start a fixture server on a background thread; return (server, base_url)."""
+    handler = type("BoundFixtureHandler", (FixtureHandler,), {
+        "state": FixtureState(corpus_size, latency, error_rate, seed),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logger.info("Fixture server listening on %s (corpus %d per source)", base_url, corpus_size)
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline stand-in for PubMed, ClinicalTrials.gov and RSS feeds")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--corpus-size", type=int, default=200, help="Items per source / per feed")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean added latency per request (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail (429 for NCBI, 503 otherwise)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    server, base_url = start_fixture_server(
+        args.host, args.port, args.corpus_size, args.latency, args.error_rate, args.seed
+    )
+    print(f"export MASH_FIXTURE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
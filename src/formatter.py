@@ -1,31 +1,108 @@
 """Formats collected content into the newsletter HTML and plain-text versions."""
 
-import base64
-import mimetypes
+import glob
+import hashlib
 import os
 import logging
+import threading
+import time
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
 
-from src.config import OUTPUT_DIR, HEADSHOT_PATH, LOGO_PATH
+from src import css_inliner
+from src.config import OUTPUT_DIR, TEMPLATE_CACHE_DIR, EMAIL_INLINE_CSS
+from src.images import newsletter_images, publish_image
+from src.instrumentation import count, span
 
 logger = logging.getLogger(__name__)
 
 TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
 
+# Templates requested as "email/<name>" get their CSS inlined.
+EMAIL_PREFIX = "email/"
 
-def _image_to_data_uri(filepath: str) -> str:
-    """Read an image file and return a base64 data URI for embedding in HTML."""
-    if not os.path.isfile(filepath):
-        logger.warning("Image not found: %s", filepath)
-        return ""
-    mime, _ = mimetypes.guess_type(filepath)
-    if not mime:
-        mime = "image/png"
-    with open(filepath, "rb") as f:
-        encoded = base64.b64encode(f.read()).decode("ascii")
-    return f"data:{mime};base64,{encoded}"
+_env: Optional[Environment] = None
+_env_lock = threading.Lock()
+
+
+class _NewsletterLoader(FileSystemLoader):
+    """
+    FileSystemLoader that minifies every template, and inlines the CSS of
+    those requested as "email/<name>" (see src.css_inliner).
+
+    Only template source is transformed, so each issue's items need no
+    post-processing. The result is cached on disk per template and variant,
+    keyed by a hash of the original source, so the transform runs once per
+    template change and replaces the previous version.
+    """
+
+    def get_source(self, environment, template):
+        inline = template.startswith(EMAIL_PREFIX)
+        name = template[len(EMAIL_PREFIX):] if inline else template
+        source, filename, uptodate = super().get_source(environment, name)
+        return _transform(name, source, inline), filename, uptodate
+
+
+def _transform(name: str, source: str, inline: bool) -> str:
+    key = hashlib.sha1(
+        f"{inline}|{os.path.getmtime(css_inliner.__file__)}|{source}".encode("utf-8")
+    ).hexdigest()
+    prefix = f"source-{name.replace('/', '_')}-{'email' if inline else 'web'}-"
+    path = os.path.join(TEMPLATE_CACHE_DIR, f"{prefix}{key}.html")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        pass
+
+    started = time.perf_counter()
+    transformed = css_inliner.minify_html(css_inliner.inline_css(source) if inline else source)
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(transformed)
+    os.replace(tmp, path)
+    # Drop this template's earlier versions
+    for stale in glob.glob(os.path.join(TEMPLATE_CACHE_DIR, f"{glob.escape(prefix)}*.html")):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    logger.info(
+        "Prepared %s template source: %d -> %d bytes in %.1f ms",
+        "inlined" if inline else "minified", len(source), len(transformed),
+        (time.perf_counter() - started) * 1e3,
+    )
+    return transformed
+
+
+def _get_environment() -> Environment:
+    """
+    Return the shared Jinja environment, creating it on first use.
+
+    Compiled templates stay cached in memory and are recompiled only when the
+    template file's mtime changes (auto_reload). Their bytecode is also cached
+    on disk, keyed by source checksum, so a new process skips compilation.
+    """
+    global _env
+    with _env_lock:
+        if _env is None:
+            os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+            _env = Environment(
+                loader=_NewsletterLoader(TEMPLATE_DIR),
+                autoescape=True,
+                auto_reload=True,
+                bytecode_cache=FileSystemBytecodeCache(TEMPLATE_CACHE_DIR),
+            )
+        return _env
+
+
+def get_template(name: str = "newsletter.html", email: bool = False) -> Template:
+    """Return a compiled template; `email` selects the CSS-inlined variant."""
+    return _get_environment().get_template(f"{EMAIL_PREFIX}{name}" if email else name)
 
 
 def _generate_executive_summary(
@@ -89,6 +166,39 @@ def _issue_number() -> int:
     return max(1, int((now - epoch).days / 7))
 
 
+def _template_context(
+    news: list[dict],
+    publications: list[dict],
+    trials: list[dict],
+    lookback_days: int,
+    now: datetime,
+    image_refs: Optional[dict[str, str]] = None,
+) -> dict:
+    """Variables for newsletter.html; image_refs maps image name -> src (cid: URI or path)."""
+    start = now - timedelta(days=lookback_days)
+    date_range = f"{start.strftime('%b %d')} - {now.strftime('%b %d, %Y')}"
+
+    executive_summary = _generate_executive_summary(news, publications, trials)
+    image_refs = image_refs or {}
+
+    return {
+        "title": f"MASH Weekly Intelligence - {now.strftime('%b %d, %Y')}",
+        "date_range": date_range,
+        "issue_number": _issue_number(),
+        "executive_summary": executive_summary,
+        "news_articles": news,
+        "publications": publications,
+        "trials": trials,
+        "headshot_uri": image_refs.get("headshot", ""),
+        "logo_uri": image_refs.get("logo", ""),
+    }
+
+
+def issue_path(now: datetime) -> str:
+    """Path of the archived HTML for the issue rendered at `now`."""
+    return os.path.join(OUTPUT_DIR, f"mash_newsletter_{now.strftime('%Y%m%d')}.html")
+
+
 def render_newsletter(
     news: list[dict],
     publications: list[dict],
@@ -97,38 +207,37 @@ def render_newsletter(
 ) -> tuple[str, str]:
     """
     Render the newsletter and return (html_content, output_filepath).
-    Also saves the HTML to the output directory.
+
+    The returned HTML is the email version: CSS inlined (EMAIL_INLINE_CSS)
+    and images as cid: references to the parts send_newsletter attaches (see
+    src.images). The copy saved to the output directory keeps its <style>
+    block and links to image files copied next to it instead.
     """
     now = datetime.now(timezone.utc)
-    start = now - timedelta(days=lookback_days)
-    date_range = f"{start.strftime('%b %d')} - {now.strftime('%b %d, %Y')}"
-
-    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True)
-    template = env.get_template("newsletter.html")
+    images = newsletter_images()
 
-    executive_summary = _generate_executive_summary(news, publications, trials)
-
-    # Encode branding images as data URIs for email-safe embedding
-    headshot_uri = _image_to_data_uri(HEADSHOT_PATH)
-    logo_uri = _image_to_data_uri(LOGO_PATH)
-
-    html = template.render(
-        title=f"MASH Weekly Intelligence - {now.strftime('%b %d, %Y')}",
-        date_range=date_range,
-        issue_number=_issue_number(),
-        executive_summary=executive_summary,
-        news_articles=news,
-        publications=publications,
-        trials=trials,
-        headshot_uri=headshot_uri,
-        logo_uri=logo_uri,
+    started = time.perf_counter()
+    email_refs = {image.name: f"cid:{image.cid}" for image in images}
+    with span("render", variant="email"):
+        html = get_template(email=EMAIL_INLINE_CSS).render(
+            _template_context(news, publications, trials, lookback_days, now, email_refs)
+        )
+    count("render.bytes", len(html.encode("utf-8")), variant="email")
+    logger.info(
+        "Rendered email HTML: %d bytes in %.1f ms", len(html.encode("utf-8")),
+        (time.perf_counter() - started) * 1e3,
     )
 
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    filename = f"mash_newsletter_{now.strftime('%Y%m%d')}.html"
-    filepath = os.path.join(OUTPUT_DIR, filename)
+    archive_refs = {image.name: publish_image(image, OUTPUT_DIR) for image in images}
+    with span("render", variant="archive"):
+        archive_html = get_template().render(
+            _template_context(news, publications, trials, lookback_days, now, archive_refs)
+        )
+    count("render.bytes", len(archive_html.encode("utf-8")), variant="archive")
+    filepath = issue_path(now)
     with open(filepath, "w", encoding="utf-8") as f:
-        f.write(html)
+        f.write(archive_html)
 
     logger.info("Newsletter saved to %s", filepath)
     return html, filepath
@@ -162,6 +271,8 @@ def render_plain_text(
             if a.get("description"):
                 lines.append(f"  {a['description'][:200]}")
             lines.append(f"  {a['link']}")
+            for rel in a.get("also_covered_by", []):
+                lines.append(f"  Also: {rel['source']} - {rel['link']}")
         lines.append("")
 
     if publications:
@@ -174,6 +285,8 @@ def render_plain_text(
             if p.get("description"):
                 lines.append(f"  {p['description'][:200]}")
             lines.append(f"  {p['link']}")
+            for rel in p.get("also_covered_by", []):
+                lines.append(f"  Also: {rel['source']} - {rel['link']}")
         lines.append("")
 
     if trials:
@@ -182,10 +295,14 @@ def render_plain_text(
         lines.append("-" * 40)
         for t in trials:
             lines.append(f"\n* {t['title']}")
-            lines.append(f"  {t['nct_id']} | {t['status']} | {t['phase']}")
+            lines.append(f"  {t['nct_id']} | {t['status']} | {t['phase']}{' | NEW' if t.get('is_new') else ''}")
+            for change in t.get("changes", []):
+                lines.append(f"  {change['field'].capitalize()}: {change['old'] or 'none'} -> {change['new'] or 'none'}")
             if t.get("sponsor"):
                 lines.append(f"  Sponsor: {t['sponsor']}")
             lines.append(f"  {t['link']}")
+            for rel in t.get("also_covered_by", []):
+                lines.append(f"  Also: {rel['source']} - {rel['link']}")
         lines.append("")
 
     lines.append("=" * 60)
@@ -0,0 +1,167 @@
+"""Shared on-disk HTTP response cache with per-source TTLs and offline replay."""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from src.config import HTTP_CACHE_PATH, HTTP_CACHE_MAX_BYTES, HTTP_CACHE_TTLS, HTTP_REPLAY
+from src.instrumentation import count, span
+
+logger = logging.getLogger(__name__)
+
+# Query/body parameters that identify the caller rather than the resource.
+_UNKEYED_PARAMS = {"api_key"}
+
+
+def _cache_key(method: str, url: str, params: Optional[dict], data: Optional[dict]) -> str:
+    def _norm(values: Optional[dict]) -> list:
+        return sorted(
+            (str(k), str(v)) for k, v in (values or {}).items() if k not in _UNKEYED_PARAMS
+        )
+    raw = json.dumps([method.upper(), url, _norm(params), _norm(data)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class HTTPCache:
+    """
+    SQLite-backed response cache keyed by method, URL and parameters.
+
+    Only 200 responses are stored. Entries expire per source TTL and
+    the least recently used ones are evicted once the cache exceeds max_bytes.
+    """
+
+    def __init__(
+        self,
+        path: str = HTTP_CACHE_PATH,
+        ttls: Optional[dict] = None,
+        max_bytes: int = HTTP_CACHE_MAX_BYTES,
+        replay: bool = HTTP_REPLAY,
+    ):
+        self.path = path
+        self.ttls = ttls if ttls is not None else HTTP_CACHE_TTLS
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, source TEXT, url TEXT, status INTEGER,"
+                " headers TEXT, body BLOB, size INTEGER, created REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._conn = conn
+        return self._conn
+
+    def _load(self, key: str, ttl: float) -> Optional[requests.Response]:
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT url, status, headers, body, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            url, status, headers, body, created = row
+            if not self.replay and time.time() - created > ttl:
+                return None
+            db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            db.commit()
+
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers = CaseInsensitiveDict(json.loads(headers))
+        resp._content = body
+        resp.url = url
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        resp.from_cache = True
+        return resp
+
+    def _store(self, key: str, source: str, resp: requests.Response) -> None:
+        body = resp.content
+        # Bodies are stored decoded, so drop headers that describe the wire form.
+        headers = {
+            k: v for k, v in resp.headers.items()
+            if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        }
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, source, resp.url, resp.status_code, json.dumps(headers), body, len(body), now, now),
+            )
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.info("HTTP cache evicted %d entries (now %d bytes)", evicted, total)
+
+    def request(
+        self,
+        source: str,
+        method: str,
+        url: str,
+        *,
+        params: Optional[dict] = None,
+        data: Optional[dict] = None,
+        session=None,
+        before_send: Optional[Callable[[], object]] = None,
+        ttl: Optional[float] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Send a request through the cache.
+
+        `source` selects the TTL ("pubmed", "ctgov", "rss"); `ttl` overrides
+        it, and ttl=0 bypasses the cache for responses that must not be
+        reused (e.g. server-side session state). `before_send` runs only when
+        the request actually goes to the network, e.g. a rate limiter. In
+        replay mode a cache miss raises requests.ConnectionError. Other
+        keyword arguments are passed to `session.request`.
+        """
+        key = _cache_key(method, url, params, data)
+        ttl = self.ttls.get(source, 0) if ttl is None else ttl
+        if (self.replay and ttl != 0) or ttl > 0:
+            cached = self._load(key, ttl)
+            if cached is not None:
+                count("http.cache_hits", source=source)
+                return cached
+        if self.replay:
+            raise requests.ConnectionError(f"{method} {url} is not cached (replay mode)")
+
+        if before_send is not None:
+            before_send()
+        with span("http", source=source):
+            resp = (session or requests).request(method, url, params=params, data=data, **kwargs)
+        count("http.responses", source=source, status=resp.status_code)
+        count("http.bytes", len(resp.content), source=source)
+        resp.from_cache = False
+        if resp.status_code == 200 and ttl > 0:
+            self._store(key, source, resp)
+        return resp
+
+
+http_cache = HTTPCache()
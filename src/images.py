@@ -0,0 +1,111 @@
+"""
+Branding images for the newsletter.
+
+Each image in NEWSLETTER_IMAGES is resized to twice its display size and
+recompressed once, then cached under data/cache/images by a hash of the
+source bytes and target size. Emails attach the results as multipart/related
+CID parts and the archived HTML links to copies next to it, instead of
+inlining base64 data URIs into every message and file.
+
+Pillow is optional: without it the original files are used unchanged.
+"""
+
+import hashlib
+import io
+import logging
+import mimetypes
+import os
+import shutil
+from typing import NamedTuple, Optional
+
+from src.config import IMAGE_CACHE_DIR, NEWSLETTER_IMAGES
+
+logger = logging.getLogger(__name__)
+
+
+class NewsletterImage(NamedTuple):
+    name: str   # template variable / CID stem, e.g. "logo"
+    path: str   # optimized file in IMAGE_CACHE_DIR
+    mime: str
+
+    @property
+    def cid(self) -> str:
+        """Content-ID (without angle brackets) the email HTML refers to as cid:..."""
+        return f"{self.name}@mash-newsletter"
+
+
+def _pillow():
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+
+def _optimize(data: bytes, target: tuple[int, int], fit: str) -> Optional[bytes]:
+    """Downscale and recompress an image with Pillow; None if Pillow is unavailable."""
+    Image = _pillow()
+    if Image is None:
+        return None
+    with Image.open(io.BytesIO(data)) as img:
+        fmt = img.format or "PNG"
+        width, height = img.size
+        ratios = (target[0] / width, target[1] / height)
+        scale = max(ratios) if fit == "cover" else min(ratios)
+        if scale < 1:
+            img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        out = io.BytesIO()
+        if fmt == "JPEG":
+            img.convert("RGB").save(out, "JPEG", quality=85, optimize=True, progressive=True)
+        else:
+            img.save(out, fmt, optimize=True)
+    return out.getvalue()
+
+
+def prepare_image(name: str, src_path: str, display_size: tuple[int, int], fit: str = "contain") -> Optional[NewsletterImage]:
+    """Return the optimized, cached version of an image, building it on first use."""
+    if not os.path.isfile(src_path):
+        logger.warning("Image not found: %s", src_path)
+        return None
+    with open(src_path, "rb") as f:
+        original = f.read()
+
+    target = (display_size[0] * 2, display_size[1] * 2)
+    optimizer = "pillow" if _pillow() else "original"
+    key = hashlib.sha256(original + f"|{target}|{fit}|{optimizer}".encode()).hexdigest()[:16]
+    ext = os.path.splitext(src_path)[1].lower()
+    path = os.path.join(IMAGE_CACHE_DIR, f"{name}-{key}{ext}")
+
+    if not os.path.exists(path):
+        data = _optimize(original, target, fit)
+        if data is None or len(data) >= len(original):
+            data = original
+        os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        logger.info("Prepared %s image: %d -> %d bytes (%s)", name, len(original), len(data), optimizer)
+
+    mime = mimetypes.guess_type(src_path)[0] or "image/png"
+    return NewsletterImage(name, path, mime)
+
+
+def newsletter_images() -> list[NewsletterImage]:
+    """All configured branding images that exist, optimized and cached."""
+    images = []
+    for name, (src_path, display_size, fit) in NEWSLETTER_IMAGES.items():
+        image = prepare_image(name, src_path, display_size, fit)
+        if image:
+            images.append(image)
+    return images
+
+
+def publish_image(image: NewsletterImage, directory: str) -> str:
+    """Copy an image into `directory`/images (once) and return its path relative to `directory`."""
+    rel_path = f"images/{os.path.basename(image.path)}"
+    dest = os.path.join(directory, rel_path)
+    if not os.path.exists(dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(image.path, dest)
+    return rel_path
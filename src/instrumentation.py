@@ -0,0 +1,204 @@
+"""
+Lightweight run instrumentation: timing spans, counters and a JSON run report.
+
+    with span("http", source="pubmed"):
+        ...
+    count("http.bytes", len(resp.content), source="pubmed")
+
+Spans and counters are aggregated in memory per (name, labels): a span keeps
+its number of calls, the calls that raised, and total / max seconds; a
+counter keeps a sum. Recording one costs a lock and a dict update, so spans
+go around calls (HTTP requests, filters, stages), not inner loops.
+
+Inside `with run_metrics() as run:` span() and count() record into that
+run's own Metrics, so work running concurrently in other threads (e.g. a
+scheduled ingest) stays out of its report. Worker threads record into the
+run that started them when their function is wrapped with bound(); anything
+recorded outside a run goes to the process-wide `metrics`.
+
+write_report() saves everything recorded since reset() as a run report, and
+profiling() wraps a command with cProfile and tracemalloc (run.py --profile).
+"""
+
+import functools
+import io
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Callable, Iterator, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Span:
+    __slots__ = ("_metrics", "_key", "_started")
+
+    def __init__(self, metrics: "Metrics", key: tuple):
+        self._metrics = metrics
+        self._key = key
+
+    def __enter__(self) -> "_Span":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._metrics._record_span(self._key, time.perf_counter() - self._started, exc_type is not None)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Start a new run: clear all spans, counters and run info."""
+        with self._lock:
+            self._spans: dict[tuple, list] = {}  # key -> [calls, errors, total_s, max_s]
+            self._counters: dict[tuple, float] = {}
+            self.info: dict = {}
+            self.started = time.time()
+
+    def span(self, name: str, **labels) -> _Span:
+        """Time a block; an exception raised inside it counts as an error."""
+        return _Span(self, _key(name, labels))
+
+    def _record_span(self, key: tuple, seconds: float, error: bool) -> None:
+        with self._lock:
+            stats = self._spans.get(key)
+            if stats is None:
+                stats = self._spans[key] = [0, 0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += error
+            stats[2] += seconds
+            stats[3] = max(stats[3], seconds)
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def report(self) -> dict:
+        """Everything recorded since reset(), as JSON-ready data."""
+        with self._lock:
+            spans = [
+                {
+                    "name": name, "labels": dict(labels), "calls": calls, "errors": errors,
+                    "total_s": round(total, 6), "mean_s": round(total / calls, 6), "max_s": round(longest, 6),
+                }
+                for (name, labels), (calls, errors, total, longest) in sorted(self._spans.items())
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            info = dict(self.info)
+            started = self.started
+        return {
+            "started": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+            "duration_s": round(time.time() - started, 3),
+            "python": platform.python_version(),
+            "run": info,
+            "spans": spans,
+            "counters": counters,
+        }
+
+    def write_report(self, path: str) -> None:
+        """Write report() to `path` as JSON."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        logger.info("Run report saved to %s", path)
+
+
+metrics = Metrics()
+_current: ContextVar[Metrics] = ContextVar("metrics", default=metrics)
+
+
+def current() -> Metrics:
+    """The Metrics this thread records into: its run's, or the process-wide `metrics`."""
+    return _current.get()
+
+
+def span(name: str, **labels) -> _Span:
+    """Time a block into the current Metrics (see Metrics.span)."""
+    return _current.get().span(name, **labels)
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """Add to a counter in the current Metrics."""
+    _current.get().count(name, value, **labels)
+
+
+@contextmanager
+def run_metrics() -> Iterator[Metrics]:
+    """Record the enclosed block (and the workers it bound()s) into a new Metrics."""
+    run = Metrics()
+    token = _current.set(run)
+    try:
+        yield run
+    finally:
+        _current.reset(token)
+
+
+def bound(func: Callable[..., T]) -> Callable[..., T]:
+    """Wrap `func` to record into the caller's current Metrics when a worker thread runs it."""
+    target = _current.get()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs) -> T:
+        token = _current.set(target)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+@contextmanager
+def profiling(path_stem: str, top: int = 40) -> Iterator[None]:
+    """
+    Profile the enclosed block with cProfile and tracemalloc.
+
+    Writes <path_stem>.prof (load with pstats or snakeviz), <path_stem>.txt
+    (the `top` functions by cumulative time) and <path_stem>.memory.txt
+    (peak traced memory and the `top` allocation sites still held at the end).
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    os.makedirs(os.path.dirname(path_stem) or ".", exist_ok=True)
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        profiler.dump_stats(f"{path_stem}.prof")
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        with open(f"{path_stem}.txt", "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+
+        lines = [f"Peak traced memory: {peak / 1024:.1f} KiB (still held at end: {current / 1024:.1f} KiB)", ""]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:top]]
+        with open(f"{path_stem}.memory.txt", "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        logger.info("Profile saved to %s.prof / .txt / .memory.txt", path_stem)
@@ -0,0 +1,296 @@
+"""
+Persistent SQLite store of collected items, delivered issues, per-source
+watermarks and last-seen clinical trial snapshots.
+
+Items are keyed by PMID, NCT ID or canonical URL. The store remembers which
+issue each item went out in, so overlapping or re-run windows never resend
+it, and keeps a per-source high-water mark so fetchers only need to look
+back as far as the last successful fetch.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from src.config import ITEM_STORE_PATH
+from src.dates import to_timestamp
+
+logger = logging.getLogger(__name__)
+
+_NCT_RE = re.compile(r"\b(NCT\d{8})\b", re.IGNORECASE)
+_PMID_RE = re.compile(r"pubmed\.ncbi\.nlm\.nih\.gov/(\d+)")
+_TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|cmp|src)$", re.IGNORECASE)
+
+
+def canonical_url(url: str) -> str:
+    """Normalize a URL for identity: lowercase host, no www/fragment/tracking params/trailing slash."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not _TRACKING_PARAMS.match(k)
+    ))
+    return urlunsplit((parts.scheme.lower() or "https", host, parts.path.rstrip("/"), query, ""))
+
+
+def item_key(item: dict) -> str:
+    """Stable identity for an item: pmid:<id>, nct:<id> or url:<canonical url>."""
+    link = item.get("link", "") or ""
+    nct = item.get("nct_id") or ""
+    if not nct:
+        match = _NCT_RE.search(link)
+        nct = match.group(1) if match else ""
+    if nct:
+        return f"nct:{nct.upper()}"
+    match = _PMID_RE.search(link)
+    if match:
+        return f"pmid:{match.group(1)}"
+    if link:
+        return f"url:{canonical_url(link)}"
+    return f"title:{re.sub(r'[^a-z0-9]+', ' ', item.get('title', '').lower()).strip()}"
+
+
+def issue_keys(items: list[dict]) -> list[str]:
+    """Keys of an issue's items and of the links they also cover (see ItemStore.mark_sent)."""
+    keys = {}
+    for item in items:
+        keys[item_key(item)] = None
+        keys.update(dict.fromkeys(item_key(rel) for rel in item.get("also_covered_by", [])))
+    return list(keys)
+
+
+# PRAGMA user_version; bump when the stored `published` values are computed differently.
+_SCHEMA_VERSION = 2
+
+
+def _published(item: dict) -> float:
+    """
+    An item's own date (a trial's last update) as epoch seconds, 0.0 if
+    unknown. A month- or year-only date ("2026 Oct") counts as the end of
+    that period, so a paper dated by month stays selectable all month. A
+    paper PubMed added later than its publication date counts from then.
+    """
+    published = to_timestamp(item.get("date", ""), end=True) or item.get("timestamp") or 0.0
+    return max(published, to_timestamp(item.get("added", "")))
+
+
+def _revision(item: dict) -> str:
+    """Revision marker: a trial's last-update date; other items are never revised."""
+    if item.get("type") == "clinical_trial":
+        return str(item.get("date", ""))
+    return ""
+
+
+class ItemStore:
+    """SQLite-backed item store. Safe to share between threads."""
+
+    def __init__(self, path: str = ITEM_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS items (
+                    key TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    revision TEXT,
+                    payload TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    sent_issue TEXT,
+                    published REAL NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS issues (
+                    issue_id TEXT PRIMARY KEY,
+                    created REAL NOT NULL,
+                    filepath TEXT,
+                    item_count INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS issue_items (
+                    issue_id TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    PRIMARY KEY (issue_id, key)
+                );
+                CREATE TABLE IF NOT EXISTS watermarks (
+                    source TEXT PRIMARY KEY,
+                    fetched_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS trial_snapshots (
+                    nct_id TEXT PRIMARY KEY,
+                    fields TEXT NOT NULL,
+                    seen REAL NOT NULL
+                );
+                """
+            )
+            self._migrate(conn)
+            conn.execute("CREATE INDEX IF NOT EXISTS items_published ON items (source, sent_issue, published)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        """Add the published column to older stores, and recompute it when _published changed."""
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= _SCHEMA_VERSION:
+            return
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(items)")]
+        if "published" not in columns:
+            conn.execute("ALTER TABLE items ADD COLUMN published REAL NOT NULL DEFAULT 0")
+        rows = conn.execute("SELECT key, payload FROM items").fetchall()
+        conn.executemany(
+            "UPDATE items SET published = ? WHERE key = ?",
+            [(_published(json.loads(payload)), key) for key, payload in rows],
+        )
+        conn.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        logger.info("Item store: backfilled publication dates for %d items", len(rows))
+
+    # --- Watermarks ---
+
+    def watermark(self, source: str) -> Optional[float]:
+        """Epoch seconds of the last successful fetch for a source, if any."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT fetched_at FROM watermarks WHERE source = ?", (source,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, source: str, fetched_at: float) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT INTO watermarks VALUES (?, ?) "
+                "ON CONFLICT(source) DO UPDATE SET fetched_at = MAX(fetched_at, excluded.fetched_at)",
+                (source, fetched_at),
+            )
+            db.commit()
+
+    def lookback_for(self, source: str, lookback_days: int, now: Optional[float] = None) -> int:
+        """
+        Days a fetcher needs to look back to cover everything since its watermark.
+
+        Rounded up with one day of overlap (the APIs filter by date, not time),
+        and never more than lookback_days.
+        """
+        mark = self.watermark(source)
+        if mark is None:
+            return lookback_days
+        elapsed = ((now or time.time()) - mark) / 86400
+        return max(1, min(lookback_days, math.ceil(elapsed) + 1))
+
+    # --- Items ---
+
+    def upsert(self, source: str, items: Iterable[dict]) -> int:
+        """
+        Insert or refresh items; return how many were new or revised.
+
+        A trial whose LastUpdatePostDate changed since it was stored counts as
+        revised and becomes unsent again.
+        """
+        now = time.time()
+        changed = 0
+        with self._lock:
+            db = self._db()
+            for item in items:
+                key = item_key(item)
+                revision = _revision(item)
+                payload = json.dumps(item)
+                published = _published(item)
+                row = db.execute("SELECT revision FROM items WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    db.execute(
+                        "INSERT INTO items (key, source, revision, payload, first_seen, updated, published) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (key, source, revision, payload, now, now, published),
+                    )
+                    changed += 1
+                elif row[0] != revision:
+                    db.execute(
+                        "UPDATE items SET revision = ?, payload = ?, updated = ?, published = ?, sent_issue = NULL "
+                        "WHERE key = ?",
+                        (revision, payload, now, published, key),
+                    )
+                    changed += 1
+                else:
+                    db.execute("UPDATE items SET payload = ?, published = ? WHERE key = ?", (payload, published, key))
+            db.commit()
+        return changed
+
+    def unsent(self, source: str, since: float) -> list[dict]:
+        """
+        Items of a source not yet delivered and published since `since` (epoch seconds).
+
+        The item's own date decides, not when it was stored, so a long
+        backfill (e.g. --lookback 365) does not put old items in the next
+        issue. For trials that date is the last update, so a revision counts
+        as new. A month- or year-only date counts as the end of its period.
+        Items without a date fall back to when they were stored.
+        """
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT payload FROM items WHERE source = ? AND sent_issue IS NULL "
+                "AND (published >= ? OR (published = 0 AND updated >= ?)) "
+                "ORDER BY published DESC",
+                (source, since, since),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def mark_sent(self, issue_id: str, keys: list[str], filepath: str = "", item_count: int = 0) -> None:
+        """Record an issue and mark its items (`keys`, see issue_keys) as delivered."""
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?)",
+                (issue_id, time.time(), filepath, item_count),
+            )
+            db.executemany("INSERT OR IGNORE INTO issue_items VALUES (?, ?)", [(issue_id, k) for k in keys])
+            db.executemany("UPDATE items SET sent_issue = ? WHERE key = ?", [(issue_id, k) for k in keys])
+            db.commit()
+        logger.info("Recorded issue %s with %d items", issue_id, item_count)
+
+    # --- Trial snapshots ---
+
+    def has_trial_snapshots(self) -> bool:
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM trial_snapshots LIMIT 1").fetchone() is not None
+
+    def trial_snapshots(self, nct_ids: Iterable[str]) -> dict[str, dict]:
+        """Last-seen projected fields by NCT ID; IDs never seen before are absent."""
+        ids = list(nct_ids)
+        found = {}
+        with self._lock:
+            db = self._db()
+            # Stay under SQLite's bound-parameter limit.
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = db.execute(
+                    f"SELECT nct_id, fields FROM trial_snapshots WHERE nct_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                found.update((nct_id, json.loads(fields)) for nct_id, fields in rows)
+        return found
+
+    def save_trial_snapshots(self, snapshots: dict[str, dict]) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "INSERT OR REPLACE INTO trial_snapshots VALUES (?, ?, ?)",
+                [(nct_id, json.dumps(fields), now) for nct_id, fields in snapshots.items()],
+            )
+            db.commit()
+
+
+item_store = ItemStore()
@@ -0,0 +1,101 @@
+"""Compiled multi-keyword matcher shared by the relevance filters."""
+
+import re
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from src.config import RELEVANCE_REQUIRED_KEYWORDS, EXCLUSION_KEYWORDS
+
+# From about this many keywords one trie regex scan beats a substring check
+# per keyword; below it the per-keyword check is faster.
+_TRIE_MIN_KEYWORDS = 100
+_END = ""  # trie key holding the keyword that ends at a node
+
+
+def _trie_pattern(node: dict) -> str:
+    """Regex for the keywords below a trie node, stopping at the shortest one."""
+    if _END in node:
+        return ""
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items())]
+    return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive substring matcher for a fixed keyword list.
+
+    Matching is plain substring matching, exactly like
+    `any(kw.lower() in text.lower() for kw in keywords)`, with the text
+    lowercased once. Short lists are checked keyword by keyword. Longer
+    lists are compiled into a trie-shaped regex (e.g. "fib(?:er|rosis)"), so
+    each text position is tested against the keywords' shared prefixes
+    instead of every keyword in turn, and the cost of a scan grows far more
+    slowly than the list does.
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = list(keywords)
+        self._original = {}
+        for kw in self.keywords:
+            self._original.setdefault(kw.lower(), kw)
+        self._trie: dict = {}
+        self._pattern: Optional[re.Pattern] = None
+        self._starts: Optional[re.Pattern] = None
+        if len(self._original) >= _TRIE_MIN_KEYWORDS:
+            for term in self._original:
+                node = self._trie
+                for ch in term:
+                    node = node.setdefault(ch, {})
+                node[_END] = term
+            pattern = _trie_pattern(self._trie)
+            self._pattern = re.compile(pattern)
+            self._starts = re.compile(f"(?=(?:{pattern}))")
+
+    def search(self, text: str) -> bool:
+        """Return True if any keyword occurs in the text."""
+        text = text.lower()
+        if self._pattern is None:
+            return any(term in text for term in self._original)
+        return self._pattern.search(text) is not None
+
+    def matches(self, text: str) -> list[str]:
+        """
+        Return every keyword found in the text, including keywords inside or
+        overlapping other matches, in original spelling and ordered by first
+        occurrence (shorter first at the same position).
+        """
+        text = text.lower()
+        if self._starts is None:
+            found = sorted((text.find(term), len(term), term) for term in self._original if term in text)
+            return [self._original[term] for _, _, term in found]
+
+        # The regex finds where some keyword starts; walking the trie from
+        # there picks up every keyword that starts at that position.
+        hits = {}
+        for start in self._starts.finditer(text):
+            node = self._trie
+            i = start.start()
+            while True:
+                if _END in node:
+                    hits.setdefault(node[_END], None)
+                if i == len(text):
+                    break
+                node = node.get(text[i])
+                if node is None:
+                    break
+                i += 1
+        return [self._original[term] for term in hits]
+
+
+@lru_cache(maxsize=None)
+def _matcher_for(keywords: tuple[str, ...]) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
+
+def matcher_for(keywords: Iterable[str]) -> KeywordMatcher:
+    """Return a cached matcher for an arbitrary keyword list (e.g. per-feed keywords)."""
+    return _matcher_for(tuple(keywords))
+
+
+RELEVANCE_MATCHER = KeywordMatcher(RELEVANCE_REQUIRED_KEYWORDS)
+EXCLUSION_MATCHER = KeywordMatcher(EXCLUSION_KEYWORDS)
@@ -1,15 +1,30 @@
 """Fetches MASH-related news from RSS feeds and industry sources."""
 
+import hashlib
+import io
+import json
 import re
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Iterator, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
-from dateutil import parser as dateparser
-
-from src.config import NEWS_FEEDS, LOOKBACK_DAYS, RELEVANCE_REQUIRED_KEYWORDS, EXCLUSION_KEYWORDS
+from lxml import etree
+
+from src.config import (
+    NEWS_FEEDS, NEWS_FETCH_WORKERS, FEED_EARLY_STOP_STALE, LOOKBACK_DAYS,
+    RELEVANCE_REQUIRED_KEYWORDS, EXCLUSION_KEYWORDS,
+)
+from src.dates import parse_date
+from src.feed_cache import feed_cache
+from src.http_cache import http_cache
+from src.instrumentation import bound, count, span
+from src.keyword_matcher import KeywordMatcher, RELEVANCE_MATCHER, EXCLUSION_MATCHER, matcher_for
 
 # Disease terms that MUST appear in the article title for high-confidence filtering.
 # This prevents articles that only mention MASH in passing (deep in the body text)
@@ -19,43 +34,58 @@ _TITLE_DISEASE_TERMS = [
     "hepatic steatosis", "liver fibrosis", "hepatic fibrosis",
     "rezdiffra", "resmetirom", "efruxifermin", "pegozafermin",
 ]
+_TITLE_MATCHER = KeywordMatcher(_TITLE_DISEASE_TERMS)
+# Part of the feed cache signature; bump when the article dict changes shape.
+_ARTICLE_VERSION = 2
 
 logger = logging.getLogger(__name__)
 
 REQUEST_TIMEOUT = 15
 HEADERS = {
-    "User-Agent": "MASH-Newsletter-Agent/1.0 (research newsletter aggregator)"
+    "User-Agent": "MASH-Newsletter-Agent/1.0 (research newsletter aggregator)",
+    "Accept-Encoding": "gzip, deflate",
 }
 
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Return the shared keep-alive session used for all feed requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            adapter = HTTPAdapter(pool_connections=NEWS_FETCH_WORKERS, pool_maxsize=NEWS_FETCH_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
 
 def _matches_keywords(text: str, keywords: list[str]) -> bool:
     """Check if text contains any of the given keywords (case-insensitive)."""
-    text_lower = text.lower()
-    return any(kw.lower() in text_lower for kw in keywords)
+    return matcher_for(keywords).search(text)
 
 
 def _is_relevant(text: str) -> bool:
     """Verify article is about MASH/NASH/fatty liver disease."""
-    return _matches_keywords(text, RELEVANCE_REQUIRED_KEYWORDS)
+    return RELEVANCE_MATCHER.search(text)
 
 
 def _should_exclude(text: str) -> bool:
     """Exclude animal studies, cell biology, phase 1, and preclinical content."""
-    text_lower = text.lower()
-    return any(kw.lower() in text_lower for kw in EXCLUSION_KEYWORDS)
+    matched = EXCLUSION_MATCHER.matches(text)
+    if matched:
+        logger.debug("Excluding %r: matched %s", text[:80], ", ".join(matched))
+    return bool(matched)
 
 
-def _parse_date(date_str: str) -> Optional[datetime]:
-    """Parse a date string into a timezone-aware datetime."""
-    if not date_str:
-        return None
-    try:
-        dt = dateparser.parse(date_str)
-        if dt and dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        return dt
-    except (ValueError, OverflowError):
-        return None
+def _filter_signature(keywords: list[str]) -> str:
+    """Fingerprint the filter settings that cached feed items were built with."""
+    settings = [_ARTICLE_VERSION, keywords, RELEVANCE_REQUIRED_KEYWORDS, EXCLUSION_KEYWORDS, _TITLE_DISEASE_TERMS]
+    return hashlib.sha1(json.dumps(settings).encode("utf-8")).hexdigest()
 
 
 def _clean_html(html: str) -> str:
@@ -66,96 +96,243 @@ def _clean_html(html: str) -> str:
     return soup.get_text(separator=" ", strip=True)[:500]
 
 
-def fetch_rss_feed(feed_config: dict, cutoff: datetime) -> list[dict]:
-    """Fetch and parse a single RSS feed, filtering for MASH-relevant articles."""
-    articles = []
+def _local_name(elem) -> str:
+    """Tag name without namespace, so RSS and Atom elements match alike."""
+    tag = elem.tag
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def _find(item, name: str):
+    """First descendant of a feed item with the given local name, or None."""
+    for elem in item.iterdescendants():
+        if _local_name(elem) == name:
+            return elem
+    return None
+
+
+def _find_first(item, *names: str):
+    """First match for the earliest name in `names` that the item contains."""
+    for name in names:
+        elem = _find(item, name)
+        if elem is not None:
+            return elem
+    return None
+
+
+def _text(elem, strip: bool = True) -> str:
+    """Text content of an element (bs4 get_text semantics)."""
+    if strip:
+        return "".join(t.strip() for t in elem.itertext())
+    return "".join(elem.itertext())
+
+
+def parse_feed(content: bytes, name: str, keywords: list[str], cutoff: datetime) -> Iterator[dict]:
+    """
+    Stream MASH-relevant articles out of an RSS or Atom document.
+
+    Items are parsed one at a time and freed afterwards. The cheap checks
+    (date, title terms) run before the description is HTML-cleaned, so
+    rejected items never pay for _clean_html. While the feed is in
+    newest-first order, parsing stops after FEED_EARLY_STOP_STALE
+    consecutive items older than the cutoff.
+
+    Yields cache entries: {"published": iso8601 or None, "article": {...}}.
+    """
+    context = etree.iterparse(
+        io.BytesIO(content), events=("end",), tag=("{*}item", "{*}entry"),
+        recover=True, resolve_entities=False, no_network=True,
+    )
+    in_order = True
+    stale_run = 0
+    previous_date = None
+    seen = 0
+
+    for _, item in context:
+        seen += 1
+        entry = _parse_item(item, name, keywords, cutoff)
+        pub_date = entry.pop("pub_date")
+        item.clear(keep_tail=True)
+        while item.getprevious() is not None:
+            del item.getparent()[0]
+
+        if pub_date:
+            if previous_date and pub_date > previous_date:
+                in_order = False
+            previous_date = pub_date
+            if pub_date < cutoff:
+                stale_run += 1
+                if in_order and stale_run >= FEED_EARLY_STOP_STALE:
+                    logger.debug("Stopping %s after %d items: past the cutoff", name, seen)
+                    return
+                continue
+            stale_run = 0
+
+        if entry["article"]:
+            yield entry
+
+
+def _parse_item(item, name: str, keywords: list[str], cutoff: datetime) -> dict:
+    """Apply the relevance filters to one feed item; article is None if it is rejected."""
+    pub_tag = _find_first(item, "pubDate", "published", "updated")
+    pub_date = parse_date(_text(pub_tag) if pub_tag is not None else "")
+    entry = {"pub_date": pub_date, "article": None}
+
+    # Filter by date
+    if pub_date and pub_date < cutoff:
+        count("filter.rejected", filter="news.date")
+        return entry
+
+    title_tag = _find(item, "title")
+    title = _text(title_tag) if title_tag is not None else ""
+
+    # Title must contain a liver-disease keyword to avoid articles that
+    # only mention MASH in passing deep in the body text
+    if not _TITLE_MATCHER.search(title):
+        count("filter.rejected", filter="news.title")
+        return entry
+
+    desc_tag = _find_first(item, "description", "summary", "content")
+    description = _clean_html(_text(desc_tag, strip=False) if desc_tag is not None else "")
+
+    # Filter by keywords in title or description
+    combined = f"{title} {description}"
+    if not _matches_keywords(combined, keywords):
+        count("filter.rejected", filter="news.keywords")
+        return entry
+
+    # Strict relevance check: must mention MASH/NASH/fatty liver
+    if not _is_relevant(combined):
+        count("filter.rejected", filter="news.relevance")
+        return entry
+
+    # Exclude animal studies, cell biology, phase 1
+    if _should_exclude(combined):
+        count("filter.rejected", filter="news.exclusion")
+        return entry
+
+    link_tag = _find(item, "link")
+    if link_tag is not None:
+        link = link_tag.get("href") or _text(link_tag)
+    else:
+        link = ""
+
+    count("filter.kept", filter="news")
+    entry["published"] = pub_date.astimezone(timezone.utc).isoformat() if pub_date else None
+    entry["article"] = {
+        "title": title,
+        "link": link,
+        "description": description,
+        "date": pub_date.strftime("%Y-%m-%d") if pub_date else "Unknown",
+        "timestamp": pub_date.timestamp() if pub_date else 0.0,
+        "source": name,
+        "type": "industry_news",
+    }
+    return entry
+
+
+def fetch_rss_feed(feed_config: dict, cutoff: datetime) -> Optional[list[dict]]:
+    """
+    Fetch and parse a single RSS feed, filtering for MASH-relevant articles.
+    Returns None if the feed could not be fetched or parsed.
+    """
     name = feed_config["name"]
     url = feed_config["url"]
     keywords = feed_config["keywords"]
+    signature = _filter_signature(keywords)
+
+    # Only revalidate when the cached items were filtered with the same
+    # settings and a cutoff at least as wide as this one.
+    cached = feed_cache.get(url)
+    if cached and (cached.get("signature") != signature or cached.get("cutoff", "") > cutoff.isoformat()):
+        cached = None
 
+    started = time.monotonic()
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=REQUEST_TIMEOUT)
+        resp = http_cache.request(
+            "rss", "GET", url, session=_get_session(),
+            headers=feed_cache.conditional_headers(cached), timeout=REQUEST_TIMEOUT,
+        )
         resp.raise_for_status()
     except requests.RequestException as e:
-        logger.warning("Failed to fetch %s (%s): %s", name, url, e)
+        logger.warning("Failed to fetch %s (%s) after %.2fs: %s", name, url, time.monotonic() - started, e)
+        return None
+    fetched = time.monotonic()
+
+    if resp.status_code == 304 and cached:
+        saved = feed_cache.record_hit(url)
+        articles = [
+            entry["article"] for entry in cached["items"]
+            if not entry["published"] or entry["published"] >= cutoff.isoformat()
+        ]
+        logger.info(
+            "Feed %s not modified - reused %d cached articles (saved %d bytes, %.2fs)",
+            name, len(articles), saved, fetched - started,
+        )
         return articles
 
-    soup = BeautifulSoup(resp.content, "xml")
-    items = soup.find_all("item") or soup.find_all("entry")
-
-    for item in items:
-        title_tag = item.find("title")
-        title = title_tag.get_text(strip=True) if title_tag else ""
-
-        link_tag = item.find("link")
-        if link_tag:
-            link = link_tag.get("href") or link_tag.get_text(strip=True)
-        else:
-            link = ""
+    try:
+        with span("parse", source="rss"):
+            entries = list(parse_feed(resp.content, name, keywords, cutoff))
+    except etree.XMLSyntaxError as e:
+        # e.g. an empty 200 body; not cached, so the next run fetches it again
+        logger.warning("Failed to parse %s (%s): %s", name, url, e)
+        return None
 
-        desc_tag = (
-            item.find("description")
-            or item.find("summary")
-            or item.find("content")
-        )
-        description = _clean_html(desc_tag.get_text() if desc_tag else "")
-
-        pub_tag = item.find("pubDate") or item.find("published") or item.find("updated")
-        pub_date = _parse_date(pub_tag.get_text(strip=True) if pub_tag else "")
-
-        # Filter by date
-        if pub_date and pub_date < cutoff:
-            continue
-
-        # Filter by keywords in title or description
-        combined = f"{title} {description}"
-        if not _matches_keywords(combined, keywords):
-            continue
-
-        # Strict relevance check: must mention MASH/NASH/fatty liver
-        if not _is_relevant(combined):
-            continue
-
-        # Title must contain a liver-disease keyword to avoid articles that
-        # only mention MASH in passing deep in the body text
-        if not _matches_keywords(title, _TITLE_DISEASE_TERMS):
-            continue
-
-        # Exclude animal studies, cell biology, phase 1
-        if _should_exclude(combined):
-            continue
-
-        articles.append({
-            "title": title,
-            "link": link,
-            "description": description,
-            "date": pub_date.strftime("%Y-%m-%d") if pub_date else "Unknown",
-            "source": name,
-            "type": "industry_news",
-        })
-
-    logger.info("Fetched %d MASH articles from %s", len(articles), name)
+    feed_cache.store(url, resp, entries, signature, cutoff.isoformat())
+    articles = [entry["article"] for entry in entries]
+    logger.info(
+        "Fetched %d MASH articles from %s (%d bytes, fetch %.2fs, parse %.2fs)",
+        len(articles), name, len(resp.content), fetched - started, time.monotonic() - fetched,
+    )
     return articles
 
 
-def fetch_all_news(lookback_days: int = LOOKBACK_DAYS) -> list[dict]:
-    """Fetch MASH-relevant news from all configured RSS feeds."""
-    cutoff = datetime.now(timezone.utc) - timedelta(days=lookback_days)
-    all_articles = []
-
-    for feed_config in NEWS_FEEDS:
-        articles = fetch_rss_feed(feed_config, cutoff)
-        all_articles.extend(articles)
-
-    # Deduplicate by title similarity
+def dedupe_titles(articles: list[dict]) -> list[dict]:
+    """Drop articles whose normalized title was already seen, keeping the first."""
     seen_titles = set()
     unique = []
-    for a in all_articles:
+    for a in articles:
         normalized = re.sub(r'\W+', ' ', a["title"].lower()).strip()
         if normalized not in seen_titles:
             seen_titles.add(normalized)
             unique.append(a)
+    count("filter.rejected", len(articles) - len(unique), filter="news.title_dedup")
+    return unique
+
 
-    unique.sort(key=lambda x: x["date"], reverse=True)
+class NewsArticles(list):
+    """The articles returned by fetch_all_news, plus the names of the feeds that failed."""
+
+    def __init__(self, articles: list[dict], failed_feeds: list[str]):
+        super().__init__(articles)
+        self.failed_feeds = failed_feeds
+
+
+def fetch_all_news(lookback_days: int = LOOKBACK_DAYS) -> NewsArticles:
+    """
+    Fetch MASH-relevant news from all configured RSS feeds.
+
+    A feed that fails is skipped and listed in `failed_feeds`; raises only
+    if every feed failed.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+    all_articles = []
+    failed = []
+
+    # Feeds are independent, so a stalled feed only ties up its own worker.
+    # map() preserves NEWS_FEEDS order, which keeps title dedup deterministic.
+    workers = max(1, min(NEWS_FETCH_WORKERS, len(NEWS_FEEDS)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rss") as pool:
+        results = pool.map(bound(lambda feed: fetch_rss_feed(feed, cutoff)), NEWS_FEEDS)
+        for feed, articles in zip(NEWS_FEEDS, results):
+            if articles is None:
+                failed.append(feed["name"])
+            else:
+                all_articles.extend(articles)
+    if NEWS_FEEDS and len(failed) == len(NEWS_FEEDS):
+        raise RuntimeError(f"All {len(failed)} RSS feeds failed")
+
+    unique = dedupe_titles(all_articles)
+    unique.sort(key=lambda x: x["timestamp"], reverse=True)
     logger.info("Total unique news articles: %d", len(unique))
-    return unique
+    return NewsArticles(unique, failed)
@@ -0,0 +1,237 @@
+"""
+Durable outbox for newsletter delivery.
+
+An issue is spooled before any delivery attempt: the serialized message
+(without a To header, see src.emailer.addressed_copy) is written to
+OUTBOX_DIR/<issue_id>.eml and each recipient's delivery state to
+<issue_id>.json. flush() sends to the recipients still pending and
+reschedules failures with exponential backoff; an entry is removed once no
+recipient is pending. A message that could not be sent is therefore resent
+later (`run.py --flush-outbox`) without fetching or rendering the issue again.
+An issue spooled with its items marks them sent in the item store on its
+first successful delivery, so an issue no recipient receives (e.g. every
+address rejected) leaves its items for the next one.
+
+Delivery is at-least-once: state is saved after each delivery pass, so a
+process killed mid-pass may resend to recipients it had already reached.
+Recipients the server rejects permanently (5xx) are not retried.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from email.message import EmailMessage
+from typing import Optional
+
+from src import emailer
+from src.config import (
+    OUTBOX_DIR, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_SECONDS,
+    OUTBOX_RETRY_MAX_SECONDS, OUTBOX_FLUSH_WAIT_SECONDS,
+)
+from src.item_store import issue_keys, item_store
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+REJECTED = "rejected"
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _backoff(attempts: int) -> float:
+    """Seconds to wait after the `attempts`-th failed attempt."""
+    return min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS)
+
+
+def _counts(entry: dict) -> dict[str, int]:
+    counts = {PENDING: 0, SENT: 0, REJECTED: 0}
+    for state in entry["recipients"].values():
+        counts[state["status"]] += 1
+    return counts
+
+
+class Outbox:
+    def __init__(self, directory: str = OUTBOX_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, issue_id: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{issue_id}.{ext}")
+
+    def _load(self, issue_id: str) -> Optional[dict]:
+        try:
+            with open(self._path(issue_id, "json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Unreadable outbox entry %s: %s", issue_id, e)
+            return None
+
+    def _save(self, entry: dict) -> None:
+        _write_atomic(self._path(entry["issue_id"], "json"), json.dumps(entry, indent=2).encode("utf-8"))
+
+    def _remove(self, issue_id: str) -> None:
+        for ext in ("eml", "json"):
+            try:
+                os.remove(self._path(issue_id, ext))
+            except FileNotFoundError:
+                pass
+
+    def spool(
+        self, issue_id: str, message: EmailMessage, recipients: list[str], filepath: str = "",
+        items: Optional[list[dict]] = None,
+    ) -> None:
+        """
+        Write a built message and its recipients to the outbox.
+
+        `items` are the issue's items from the item store, marked sent once
+        the message first reaches a recipient. Re-spooling an issue (e.g. a
+        rerun on the same day) replaces its message but keeps recipients it
+        was already delivered to as sent.
+        """
+        payload = emailer.serialize_message(message)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            previous = self._load(issue_id) if os.path.exists(self._path(issue_id, "json")) else None
+            prior = previous["recipients"] if previous else {}
+            states = {}
+            for recipient in emailer.normalize_recipients(recipients):
+                if prior.get(recipient, {}).get("status") == SENT:
+                    states[recipient] = prior[recipient]
+                else:
+                    states[recipient] = {"status": PENDING, "attempts": 0, "next_attempt": 0.0, "error": ""}
+            entry = {
+                "issue_id": issue_id,
+                "spooled": time.time(),
+                "subject": str(message["Subject"]),
+                "filepath": filepath,
+                "bytes": len(payload),
+                "recipients": states,
+            }
+            if items is not None:
+                entry.update(items=issue_keys(items), item_count=len(items), delivered=False)
+            # The .json is written last: an entry is complete once it exists.
+            _write_atomic(self._path(issue_id, "eml"), payload)
+            self._save(entry)
+        logger.info(
+            "Spooled issue %s (%d bytes) for %d recipient(s)", issue_id, len(payload), _counts(entry)[PENDING]
+        )
+
+    def pending(self, issue_ids: Optional[list[str]] = None) -> list[str]:
+        """Issue ids with messages in the outbox (or those of `issue_ids`), oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name[:-len(".json")] for name in os.listdir(self.directory)
+            if name.endswith(".json") and os.path.exists(self._path(name[:-len(".json")], "eml"))
+            and (issue_ids is None or name[:-len(".json")] in issue_ids)
+        )
+
+    def _mark_delivered(self, entry: dict) -> None:
+        """Mark the issue's items sent in the item store, on its first delivery."""
+        item_store.mark_sent(entry["issue_id"], entry["items"], entry["filepath"], entry["item_count"])
+        entry["delivered"] = True
+        self._save(entry)
+
+    def _send(self, entry: dict, recipients: list[str]) -> list[emailer.DeliveryResult]:
+        with open(self._path(entry["issue_id"], "eml"), "rb") as f:
+            payload = f.read()
+        results = emailer.deliver(payload, recipients)
+        now = time.time()
+        for result in results:
+            state = entry["recipients"][result.recipient]
+            state["attempts"] += 1
+            if result.sent:
+                state.update(status=SENT, error="", sent_at=now)
+            elif result.permanent:
+                state.update(status=REJECTED, error=result.error)
+            else:
+                state.update(error=result.error, next_attempt=now + _backoff(state["attempts"]))
+        self._save(entry)
+        return results
+
+    def flush(
+        self, force: bool = False, max_wait: float = OUTBOX_FLUSH_WAIT_SECONDS,
+        issue_ids: Optional[list[str]] = None,
+    ) -> dict[str, dict[str, int]]:
+        """
+        Deliver every spooled issue (or just `issue_ids`) to its pending recipients.
+
+        Recipients whose retry is due are sent to; failures are retried in
+        this call while the next retry falls within `max_wait` seconds. With
+        `force`, the first pass ignores the backoff and attempt limit. The
+        outbox is locked for each delivery pass, not while waiting to retry.
+        Returns per-issue counts of pending, sent and rejected recipients.
+        """
+        summary = {}
+        if not emailer.credentials_configured():
+            logger.error("SMTP credentials not configured; leaving messages in the outbox")
+            with self._lock:
+                for issue_id in self.pending(issue_ids):
+                    entry = self._load(issue_id)
+                    if entry:
+                        summary[issue_id] = _counts(entry)
+            return summary
+
+        deadline = time.time() + max_wait
+        while True:
+            next_retry = None
+            auth_failed = False
+            with self._lock:
+                for issue_id in self.pending(issue_ids):
+                    entry = self._load(issue_id)
+                    if entry is None:
+                        continue
+                    now = time.time()
+                    due = [
+                        recipient for recipient, state in entry["recipients"].items()
+                        if state["status"] == PENDING
+                        and (force or (state["attempts"] < OUTBOX_MAX_ATTEMPTS and state["next_attempt"] <= now))
+                    ]
+                    if due:
+                        logger.info("Delivering issue %s to %d recipient(s)", issue_id, len(due))
+                        results = self._send(entry, due)
+                        auth_failed |= any(r.error.startswith(emailer.AUTH_FAILED) for r in results)
+                        if entry.get("delivered") is False and any(r.sent for r in results):
+                            self._mark_delivered(entry)
+
+                    counts = summary[issue_id] = _counts(entry)
+                    if not counts[PENDING]:
+                        self._remove(issue_id)
+                        logger.info(
+                            "Issue %s delivered to %d recipient(s), %d rejected",
+                            issue_id, counts[SENT], counts[REJECTED],
+                        )
+                        continue
+                    retries = [
+                        state["next_attempt"] for state in entry["recipients"].values()
+                        if state["status"] == PENDING and state["attempts"] < OUTBOX_MAX_ATTEMPTS
+                    ]
+                    if retries:
+                        next_retry = min(retries + ([next_retry] if next_retry else []))
+                    if len(retries) < counts[PENDING]:
+                        logger.warning(
+                            "Issue %s: %d recipient(s) out of retries; resend with --flush-outbox",
+                            issue_id, counts[PENDING] - len(retries),
+                        )
+            force = False
+
+            # Bad credentials will not fix themselves within this run.
+            if auth_failed or next_retry is None or next_retry > deadline:
+                break
+            delay = max(0.0, next_retry - time.time())
+            logger.info("Retrying failed deliveries in %.0fs", delay)
+            time.sleep(delay)
+        return summary
+
+
+outbox = Outbox()
@@ -1,16 +1,24 @@
 """Fetches recent MASH clinical trial publications from PubMed via NCBI E-utilities."""
 
+import io
 import logging
-import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
 
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
 
+from src import instrumentation
 from src.config import (
-    PUBMED_BASE, PUBMED_SEARCH_TERMS, PUBMED_MAX_RESULTS, LOOKBACK_DAYS,
-    RELEVANCE_REQUIRED_KEYWORDS, EXCLUSION_KEYWORDS,
+    PUBMED_BASE, NCBI_API_KEY, NCBI_REQUESTS_PER_SECOND, NCBI_MAX_RETRIES,
+    PUBMED_SEARCH_TERMS, PUBMED_MAX_RESULTS, LOOKBACK_DAYS,
+    PUBMED_HISTORY_MIN_LOOKBACK, PUBMED_HISTORY_MAX_RECORDS, PUBMED_EFETCH_BATCH,
 )
+from src.dates import to_timestamp
+from src.http_cache import http_cache
+from src.keyword_matcher import RELEVANCE_MATCHER, EXCLUSION_MATCHER
+from src.rate_limiter import TokenBucket
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +27,41 @@ HEADERS = {
     "User-Agent": "MASH-Newsletter-Agent/1.0 (research aggregator; contact don@nuecura.com)"
 }
 
+# Every E-utilities call goes through this bucket, so concurrent callers
+# stay within NCBI's per-second limit between them. capacity=1: no burst,
+# since NCBI counts requests per second, not per average.
+ncbi_limiter = TokenBucket(NCBI_REQUESTS_PER_SECOND, capacity=1)
+
+
+def _eutils_request(method: str, endpoint: str, params: dict) -> requests.Response:
+    """
+    Send a rate-limited E-utilities request, backing off and retrying on 429.
+
+    History-server requests (usehistory, WebEnv) bypass the HTTP cache: a
+    WebEnv is a session that expires on NCBI's side, so a cached one may be
+    dead. Raises requests.RequestException if the request ultimately fails.
+    """
+    ttl = 0 if params.get("usehistory") == "y" or "WebEnv" in params else None
+    if NCBI_API_KEY:
+        params = {**params, "api_key": NCBI_API_KEY}
+    payload = {"params": params} if method == "GET" else {"data": params}
+
+    for attempt in range(NCBI_MAX_RETRIES + 1):
+        resp = http_cache.request(
+            "pubmed", method, f"{PUBMED_BASE}/{endpoint}", headers=HEADERS,
+            timeout=REQUEST_TIMEOUT, before_send=ncbi_limiter.acquire, ttl=ttl, **payload
+        )
+        if resp.status_code != 429 or attempt == NCBI_MAX_RETRIES:
+            break
+        try:
+            delay = float(resp.headers.get("Retry-After", ""))
+        except ValueError:
+            delay = 2 ** attempt
+        logger.warning("NCBI rate limit hit on %s; backing off %.1fs", endpoint, delay)
+        ncbi_limiter.backoff(delay)
+    resp.raise_for_status()
+    return resp
+
 
 def _date_range(lookback_days: int) -> tuple[str, str]:
     """Return (mindate, maxdate) strings for PubMed in YYYY/MM/DD format."""
@@ -27,143 +70,233 @@ def _date_range(lookback_days: int) -> tuple[str, str]:
     return start.strftime("%Y/%m/%d"), end.strftime("%Y/%m/%d")
 
 
-def search_pubmed(query: str, max_results: int, mindate: str, maxdate: str) -> list[str]:
-    """Search PubMed and return a list of PMIDs."""
+def search_pubmed(query: str, max_results: int, mindate: str, maxdate: str, datetype: str = "pdat") -> list[str]:
+    """
+    Search PubMed and return a list of PMIDs; raises if the search fails.
+    `datetype` is "pdat" (publication date) or "edat" (added to PubMed).
+    """
     params = {
         "db": "pubmed",
         "term": query,
         "retmax": max_results,
         "sort": "date",
-        "datetype": "pdat",
+        "datetype": datetype,
         "mindate": mindate,
         "maxdate": maxdate,
         "retmode": "json",
     }
     try:
-        resp = requests.get(
-            f"{PUBMED_BASE}/esearch.fcgi", params=params,
-            headers=HEADERS, timeout=REQUEST_TIMEOUT
-        )
-        resp.raise_for_status()
+        resp = _eutils_request("GET", "esearch.fcgi", params)
         data = resp.json()
         return data.get("esearchresult", {}).get("idlist", [])
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         logger.warning("PubMed search failed for '%s': %s", query, e)
-        return []
+        raise
 
 
-def fetch_pubmed_details(pmids: list[str]) -> list[dict]:
-    """Fetch article details for a list of PMIDs using efetch."""
-    if not pmids:
-        return []
+def search_pubmed_history(
+    query: str, mindate: str, maxdate: str, webenv: Optional[str] = None, datetype: str = "pdat"
+) -> tuple[str, str, int]:
+    """
+    Run a search on the E-utilities history server.
 
+    Returns (webenv, query_key, count); raises if the search fails. Pass the
+    WebEnv of an earlier search to keep its query keys available for combining.
+    """
     params = {
         "db": "pubmed",
-        "id": ",".join(pmids),
-        "retmode": "xml",
+        "term": query,
+        "usehistory": "y",
+        "retmax": 0,
+        "datetype": datetype,
+        "mindate": mindate,
+        "maxdate": maxdate,
+        "retmode": "json",
     }
+    if webenv:
+        params["WebEnv"] = webenv
     try:
-        resp = requests.get(
-            f"{PUBMED_BASE}/efetch.fcgi", params=params,
-            headers=HEADERS, timeout=REQUEST_TIMEOUT
-        )
-        resp.raise_for_status()
+        resp = _eutils_request("POST", "esearch.fcgi", params)
+        result = resp.json().get("esearchresult", {})
+        return result["webenv"], result["querykey"], int(result.get("count", 0))
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logger.warning("PubMed history search failed for '%s': %s", query[:80], e)
+        raise
+
+
+def _efetch(data: dict) -> bytes:
+    """POST an efetch request and return the raw XML; raises if the request fails."""
+    params = {"db": "pubmed", "retmode": "xml", **data}
+    try:
+        resp = _eutils_request("POST", "efetch.fcgi", params)
     except requests.RequestException as e:
         logger.warning("PubMed efetch failed: %s", e)
-        return []
-
-    soup = BeautifulSoup(resp.content, "xml")
-    articles = []
+        raise
+    return resp.content
 
-    for article in soup.find_all("PubmedArticle"):
-        medline = article.find("MedlineCitation")
-        if not medline:
-            continue
 
-        pmid_tag = medline.find("PMID")
-        pmid = pmid_tag.get_text(strip=True) if pmid_tag else ""
+def fetch_pubmed_details(pmids: list[str]) -> list[dict]:
+    """Fetch article details for a list of PMIDs using efetch."""
+    articles = []
+    # POST keeps long ID lists out of the URL; batching bounds each response.
+    for i in range(0, len(pmids), PUBMED_EFETCH_BATCH):
+        content = _efetch({"id": ",".join(pmids[i:i + PUBMED_EFETCH_BATCH])})
+        if content:
+            with instrumentation.span("parse", source="pubmed"):
+                articles.extend(_parse_efetch(content))
+    return articles
 
-        title_tag = medline.find("ArticleTitle")
-        title = title_tag.get_text(strip=True) if title_tag else "Untitled"
 
-        abstract_tag = medline.find("Abstract")
-        if abstract_tag:
-            abstract_texts = abstract_tag.find_all("AbstractText")
-            abstract = " ".join(t.get_text(strip=True) for t in abstract_texts)
-        else:
-            abstract = ""
-        # Truncate long abstracts
-        if len(abstract) > 600:
-            abstract = abstract[:597] + "..."
-
-        # Journal
-        journal_tag = medline.find("Journal")
-        journal = ""
-        if journal_tag:
-            j_title = journal_tag.find("Title") or journal_tag.find("ISOAbbreviation")
-            journal = j_title.get_text(strip=True) if j_title else ""
-
-        # Date
-        pub_date_tag = article.find("PubDate")
-        date_str = ""
-        if pub_date_tag:
-            year = pub_date_tag.find("Year")
-            month = pub_date_tag.find("Month")
-            day = pub_date_tag.find("Day")
-            parts = []
-            if year:
-                parts.append(year.get_text(strip=True))
-            if month:
-                parts.append(month.get_text(strip=True))
-            if day:
-                parts.append(day.get_text(strip=True))
-            date_str = " ".join(parts) if parts else "Unknown"
-
-        # Authors
-        author_list = medline.find("AuthorList")
-        authors = []
-        if author_list:
-            for auth in author_list.find_all("Author")[:3]:
-                last = auth.find("LastName")
-                init = auth.find("Initials")
-                if last:
-                    name = last.get_text(strip=True)
-                    if init:
-                        name += f" {init.get_text(strip=True)}"
-                    authors.append(name)
-            if len(author_list.find_all("Author")) > 3:
-                authors.append("et al.")
-
-        # Publication type
-        pub_types = medline.find_all("PublicationType")
-        type_list = [pt.get_text(strip=True) for pt in pub_types]
-
-        articles.append({
-            "title": title,
-            "link": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
-            "description": abstract,
-            "date": date_str,
-            "source": journal or "PubMed",
-            "authors": ", ".join(authors),
-            "pub_types": type_list,
-            "type": "publication",
+def iter_history_details(webenv: str, query_key: str, count: int) -> Iterator[dict]:
+    """Stream article details for a history-server result set, one efetch batch at a time."""
+    for retstart in range(0, count, PUBMED_EFETCH_BATCH):
+        content = _efetch({
+            "WebEnv": webenv,
+            "query_key": query_key,
+            "retstart": retstart,
+            "retmax": PUBMED_EFETCH_BATCH,
         })
-
-    return articles
+        if not content:
+            # A missing batch would leave a hole in the result set.
+            raise RuntimeError(f"PubMed efetch returned no data at record {retstart} of {count}")
+        yield from iter_efetch_articles(content)
+
+
+def _text(elem) -> str:
+    """Concatenate the stripped text fragments under an element (like bs4's get_text(strip=True))."""
+    return "".join(t.strip() for t in elem.itertext())
+
+
+def iter_efetch_articles(content: bytes) -> Iterator[dict]:
+    """
+    Stream article dicts out of an efetch XML payload.
+
+    Parses one PubmedArticle at a time with lxml.iterparse and frees each
+    element (and its already-processed siblings) once it has been read, so
+    memory stays flat regardless of how many records the payload holds.
+    """
+    context = etree.iterparse(
+        io.BytesIO(content), events=("end",), tag="PubmedArticle",
+        recover=True, huge_tree=True, resolve_entities=False,
+    )
+    for _, article in context:
+        parsed = _parse_article(article)
+        article.clear(keep_tail=True)
+        parent = article.getparent()
+        if parent is not None:
+            while article.getprevious() is not None:
+                del parent[0]
+        if parsed:
+            yield parsed
+
+
+def _parse_efetch(content: bytes) -> list[dict]:
+    """Parse an efetch XML payload into article dicts."""
+    return list(iter_efetch_articles(content))
+
+
+def _parse_article(article) -> Optional[dict]:
+    """Convert one PubmedArticle element into an article dict."""
+    medline = article.find(".//MedlineCitation")
+    if medline is None:
+        return None
+
+    pmid_tag = medline.find(".//PMID")
+    pmid = _text(pmid_tag) if pmid_tag is not None else ""
+
+    title_tag = medline.find(".//ArticleTitle")
+    title = _text(title_tag) if title_tag is not None else "Untitled"
+
+    abstract_tag = medline.find(".//Abstract")
+    if abstract_tag is not None:
+        abstract = " ".join(_text(t) for t in abstract_tag.iter("AbstractText"))
+    else:
+        abstract = ""
+    # Truncate long abstracts
+    if len(abstract) > 600:
+        abstract = abstract[:597] + "..."
+
+    # Journal
+    journal_tag = medline.find(".//Journal")
+    journal = ""
+    if journal_tag is not None:
+        j_title = journal_tag.find(".//Title")
+        if j_title is None:
+            j_title = journal_tag.find(".//ISOAbbreviation")
+        journal = _text(j_title) if j_title is not None else ""
+
+    # Date
+    pub_date_tag = article.find(".//PubDate")
+    date_str = ""
+    if pub_date_tag is not None:
+        parts = []
+        for part in ("Year", "Month", "Day"):
+            tag = pub_date_tag.find(f".//{part}")
+            if tag is not None:
+                parts.append(_text(tag))
+        if parts:
+            date_str = " ".join(parts)
+        else:
+            medline_date = pub_date_tag.find(".//MedlineDate")
+            date_str = _text(medline_date) if medline_date is not None else "Unknown"
+
+    # When PubMed added the record (Entrez date), as YYYY-MM-DD
+    added = ""
+    entrez = article.find(".//PubMedPubDate[@PubStatus='entrez']")
+    if entrez is not None:
+        try:
+            added = "{:04d}-{:02d}-{:02d}".format(
+                *(int(_text(entrez.find(part))) for part in ("Year", "Month", "Day"))
+            )
+        except (AttributeError, ValueError):  # a part missing or not a number
+            pass
+
+    # Authors
+    author_list = medline.find(".//AuthorList")
+    authors = []
+    if author_list is not None:
+        all_authors = list(author_list.iter("Author"))
+        for auth in all_authors[:3]:
+            last = auth.find(".//LastName")
+            init = auth.find(".//Initials")
+            if last is not None:
+                name = _text(last)
+                if init is not None:
+                    name += f" {_text(init)}"
+                authors.append(name)
+        if len(all_authors) > 3:
+            authors.append("et al.")
+
+    # Publication type
+    type_list = [_text(pt) for pt in medline.iter("PublicationType")]
+
+    return {
+        "title": title,
+        "link": f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/",
+        "description": abstract,
+        "date": date_str,
+        "timestamp": to_timestamp(date_str),
+        "added": added,
+        "source": journal or "PubMed",
+        "authors": ", ".join(authors),
+        "pub_types": type_list,
+        "type": "publication",
+    }
 
 
 def _is_clinically_relevant(article: dict) -> bool:
     """Filter for clinical utility — exclude animal, cell biology, and phase 1 studies."""
-    text = f"{article['title']} {article['description']}".lower()
+    text = f"{article['title']} {article['description']}"
 
     # Must mention MASH/NASH/fatty liver disease
-    has_relevance = any(kw.lower() in text for kw in RELEVANCE_REQUIRED_KEYWORDS)
-    if not has_relevance:
+    if not RELEVANCE_MATCHER.search(text):
+        logger.debug("Excluded publication %r: no MASH/NASH term", article["title"][:80])
         return False
 
     # Exclude animal/preclinical/basic science/phase 1
-    has_exclusion = any(kw.lower() in text for kw in EXCLUSION_KEYWORDS)
-    if has_exclusion:
+    excluded_by = EXCLUSION_MATCHER.matches(text)
+    if excluded_by:
+        logger.debug("Excluded publication %r: matched %s", article["title"][:80], ", ".join(excluded_by))
         return False
 
     # Exclude by publication type
@@ -177,25 +310,88 @@ def _is_clinically_relevant(article: dict) -> bool:
     return True
 
 
-def fetch_all_publications(lookback_days: int = LOOKBACK_DAYS) -> list[dict]:
-    """Run all configured PubMed searches and return deduplicated results."""
-    mindate, maxdate = _date_range(lookback_days)
-    all_pmids = set()
-
+def _search_combined_history(mindate: str, maxdate: str, datetype: str) -> Optional[tuple[str, str, int]]:
+    """Run every search term on the history server and OR the results together there."""
+    webenv = None
+    query_keys = []
     for term in PUBMED_SEARCH_TERMS:
-        pmids = search_pubmed(term, PUBMED_MAX_RESULTS, mindate, maxdate)
-        all_pmids.update(pmids)
-        time.sleep(0.4)  # Be nice to NCBI
-
-    logger.info("Found %d unique PMIDs across all searches", len(all_pmids))
-    articles = fetch_pubmed_details(list(all_pmids))
+        webenv, query_key, count = search_pubmed_history(term, mindate, maxdate, webenv, datetype)
+        logger.info("PubMed history search #%s matched %d records", query_key, count)
+        query_keys.append(query_key)
+
+    if not query_keys:
+        return None
+    if len(query_keys) == 1:
+        return webenv, query_keys[0], count
+    combined = " OR ".join(f"#{key}" for key in query_keys)
+    return search_pubmed_history(combined, mindate, maxdate, webenv, datetype)
+
+
+def fetch_all_publications(
+    lookback_days: int = LOOKBACK_DAYS, use_history: Optional[bool] = None, datetype: str = "pdat"
+) -> list[dict]:
+    """
+    Run all configured PubMed searches and return deduplicated results.
+
+    With use_history (the default for lookbacks over PUBMED_HISTORY_MIN_LOOKBACK
+    days) the searches are combined on the history server and every matching
+    record is streamed back, rather than the newest PUBMED_MAX_RESULTS per term.
+    Raises if any search or efetch request fails, since the results would be
+    incomplete. The window is on publication date unless `datetype` is "edat".
+    """
+    mindate, maxdate = _date_range(lookback_days)
+    if use_history is None:
+        use_history = lookback_days > PUBMED_HISTORY_MIN_LOOKBACK
+
+    if use_history:
+        combined = _search_combined_history(mindate, maxdate, datetype)
+        if combined is None:
+            return []
+        webenv, query_key, count = combined
+        if count > PUBMED_HISTORY_MAX_RECORDS:
+            logger.warning(
+                "PubMed history search matched %d records; fetching the first %d",
+                count, PUBMED_HISTORY_MAX_RECORDS,
+            )
+            count = PUBMED_HISTORY_MAX_RECORDS
+        logger.info("Streaming %d PubMed records in batches of %d", count, PUBMED_EFETCH_BATCH)
+        articles = list(iter_history_details(webenv, query_key, count))
+    else:
+        # The shared limiter keeps parallel searches within NCBI's limits.
+        all_pmids = set()
+        with ThreadPoolExecutor(max_workers=len(PUBMED_SEARCH_TERMS) or 1) as pool:
+            for pmids in pool.map(
+                instrumentation.bound(lambda term: search_pubmed(term, PUBMED_MAX_RESULTS, mindate, maxdate, datetype)),
+                PUBMED_SEARCH_TERMS,
+            ):
+                all_pmids.update(pmids)
+
+        logger.info("Found %d unique PMIDs across all searches", len(all_pmids))
+        # Sorted, so the same IDs make the same efetch request (and cache key) every run
+        articles = fetch_pubmed_details(sorted(all_pmids))
 
     # Post-fetch clinical relevance filter
     before_count = len(articles)
-    articles = [a for a in articles if _is_clinically_relevant(a)]
+    with instrumentation.span("filter", filter="pubmed.clinical"):
+        articles = [a for a in articles if _is_clinically_relevant(a)]
     filtered = before_count - len(articles)
+    instrumentation.count("filter.kept", len(articles), filter="pubmed.clinical")
+    instrumentation.count("filter.rejected", filtered, filter="pubmed.clinical")
     if filtered:
         logger.info("Filtered out %d non-clinical/irrelevant publications", filtered)
 
-    articles.sort(key=lambda x: x["date"], reverse=True)
+    logger.info(
+        "NCBI rate limiter: %d requests at %.0f/s, %.2fs spent waiting",
+        ncbi_limiter.requests, ncbi_limiter.rate, ncbi_limiter.total_wait,
+    )
+    articles.sort(key=lambda x: x["timestamp"], reverse=True)
     return articles
+
+
+def fetch_new_publications(lookback_days: int = LOOKBACK_DAYS) -> list[dict]:
+    """
+    Publications PubMed added in the window (its Entrez date), for incremental
+    fetches into the item store. PubMed often indexes a paper days or weeks
+    after its publication date, so a short window on that date would miss it.
+    """
+    return fetch_all_publications(lookback_days, datetype="edat")
@@ -0,0 +1,53 @@
+"""Thread-safe token-bucket rate limiter shared by API clients."""
+
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Allow `rate` acquisitions per second with bursts of up to `capacity`.
+
+    Any window of T seconds admits at most capacity + rate * T acquisitions,
+    so the default capacity of 1 spaces callers 1/rate apart and never lets
+    more than `rate` through in a second. A larger capacity trades that for
+    bursts.
+
+    acquire() blocks until a token is available and returns how long the
+    caller waited. backoff() pauses every caller, e.g. after an HTTP 429.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total_wait = 0.0
+
+    def _reserve(self) -> float:
+        """Take a token (possibly going into debt) and return the delay before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            delay = max(0.0, -self._tokens / self.rate, self._paused_until - now)
+            self.requests += 1
+            self.total_wait += delay
+            return delay
+
+    def acquire(self) -> float:
+        """Block until the caller may proceed; return the seconds waited."""
+        delay = self._reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def backoff(self, seconds: float) -> None:
+        """Hold back all callers for `seconds` and drain any saved-up burst."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
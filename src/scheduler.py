@@ -1,27 +1,190 @@
-"""Scheduler for weekly Monday morning newsletter delivery."""
+"""
+Scheduler for the newsletter's recurring jobs.
 
+Each job has a cadence: slots a fixed period apart in local wall-clock time,
+e.g. hourly at :05, daily at 06:30 or every Monday at 07:00. The scheduler sleeps until the
+earliest due slot (re-checking the clock at least every SCHEDULER_MAX_SLEEP
+seconds, since a sleep does not count time the machine spends suspended),
+then hands the job to a worker thread.
+
+- Overlap: a job that is still queued or running when its next slot comes
+  up skips that slot. Jobs sharing a `group` run one at a time, in the order
+  they became due, so e.g. the send waits for a prefetch still in progress.
+  Only one scheduler can run per data directory.
+- Catch-up: the last slot each job ran for is kept in SCHEDULER_STATE_PATH.
+  On start, a job whose latest slot was missed while the scheduler was down
+  runs once immediately if that slot is within SCHEDULER_CATCH_UP.
+"""
+
+import json
 import logging
+import os
+import queue
+import threading
 import time
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple, Optional
 
-import schedule
-
-from src.config import SEND_DAY, SEND_TIME
+from src.config import SCHEDULER_STATE_PATH, SCHEDULER_CATCH_UP, SCHEDULER_MAX_SLEEP
 
 logger = logging.getLogger(__name__)
 
+# Slots are counted from a Monday midnight, in naive local time.
+_EPOCH = datetime(2024, 1, 1)
+_WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+class Cadence(NamedTuple):
+    period: timedelta
+    offset: timedelta  # first slot after _EPOCH
+
+    def previous(self, t: datetime) -> datetime:
+        """The latest slot at or before `t`."""
+        return _EPOCH + self.offset + ((t - _EPOCH - self.offset) // self.period) * self.period
+
+    def next_after(self, t: datetime) -> datetime:
+        """The earliest slot after `t`."""
+        return self.previous(t) + self.period
+
+
+def _clock(at: str) -> timedelta:
+    hours, minutes = at.split(":")
+    return timedelta(hours=int(hours), minutes=int(minutes))
+
+
+def every(period: timedelta, offset: timedelta = timedelta(0)) -> Cadence:
+    """Every `period`, at `offset` past midnight (and multiples of `period` from there)."""
+    return Cadence(period, offset % period)
+
+
+def daily(at: str) -> Cadence:
+    """Every day at "HH:MM"."""
+    return Cadence(timedelta(days=1), _clock(at))
+
+
+def weekly(day: str, at: str) -> Cadence:
+    """Every `day` (e.g. "monday") at "HH:MM"."""
+    return Cadence(timedelta(weeks=1), timedelta(days=_WEEKDAYS.index(day.lower())) + _clock(at))
 
-def start_scheduler(job_func):
-    """
-    Schedule the newsletter job for every Monday at the configured time.
-    This function blocks and runs the schedule loop.
-    """
-    getattr(schedule.every(), SEND_DAY).at(SEND_TIME).do(job_func)
-    logger.info("Scheduled newsletter for every %s at %s", SEND_DAY, SEND_TIME)
-    logger.info("Scheduler running. Press Ctrl+C to stop.")
 
-    try:
+class Job:
+    def __init__(self, name: str, func: Callable[[], object], cadence: Cadence, group: Optional[str] = None):
+        self.name = name
+        self.func = func
+        self.cadence = cadence
+        self.group = group or name
+        self.next_run: Optional[datetime] = None
+        self.busy = False
+
+
+class Scheduler:
+    def __init__(self, state_path: str = SCHEDULER_STATE_PATH):
+        self.state_path = state_path
+        self.jobs: list[Job] = []
+        self._queues: dict[str, queue.Queue] = {}
+        self._state_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._lock_file = None
+
+    def add(self, name: str, func: Callable[[], object], cadence: Cadence, group: Optional[str] = None) -> None:
+        self.jobs.append(Job(name, func, cadence, group))
+
+    # --- State ---
+
+    def _load_state(self) -> dict[str, str]:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _record(self, job: Job, slot: datetime) -> None:
+        with self._state_lock:
+            state = self._load_state()
+            state[job.name] = slot.isoformat()
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp = f"{self.state_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp, self.state_path)
+
+    def _lock_process(self) -> None:
+        """Refuse to start if another scheduler holds the lock on this data directory."""
+        try:
+            import fcntl
+        except ImportError:  # Windows: single instance not enforced
+            return
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        self._lock_file = open(f"{self.state_path}.lock", "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock_file.close()
+            raise RuntimeError(f"Another scheduler is already running ({self.state_path}.lock)")
+
+    def _first_run(self, job: Job, now: datetime, state: dict[str, str]) -> datetime:
+        """The job's next slot, or its latest missed slot if that should be caught up."""
+        missed = job.cadence.previous(now)
+        last = state.get(job.name)
+        if last and datetime.fromisoformat(last) < missed and now - missed <= SCHEDULER_CATCH_UP:
+            logger.info("Catching up %s: missed the %s run", job.name, missed.strftime("%a %Y-%m-%d %H:%M"))
+            return missed
+        return job.cadence.next_after(now)
+
+    # --- Running jobs ---
+
+    def _submit(self, job: Job, slot: datetime) -> None:
+        if job.busy:
+            logger.warning(
+                "Skipping %s (%s slot): previous run still in progress", job.name, slot.strftime("%a %H:%M")
+            )
+            return
+        job.busy = True
+        if job.group not in self._queues:
+            self._queues[job.group] = queue.Queue()
+            threading.Thread(
+                target=self._worker, args=(self._queues[job.group],), name=f"scheduler-{job.group}", daemon=True
+            ).start()
+        self._queues[job.group].put((job, slot))
+
+    def _worker(self, jobs: queue.Queue) -> None:
         while True:
-            schedule.run_pending()
-            time.sleep(60)
-    except KeyboardInterrupt:
-        logger.info("Scheduler stopped.")
+            job, slot = jobs.get()
+            started = time.monotonic()
+            logger.info("Running %s (%s slot)", job.name, slot.strftime("%a %H:%M"))
+            try:
+                job.func()
+                logger.info("%s finished in %.1fs", job.name, time.monotonic() - started)
+            except Exception:
+                logger.exception("Scheduled job %s failed", job.name)
+            finally:
+                job.busy = False
+                self._record(job, slot)
+
+    def run(self) -> None:
+        """Run the jobs until interrupted. Blocks."""
+        self._lock_process()
+        now = datetime.now()
+        state = self._load_state()
+        for job in self.jobs:
+            job.next_run = self._first_run(job, now, state)
+
+        announced = None
+        try:
+            while not self._stop.is_set():
+                job = min(self.jobs, key=lambda j: j.next_run)
+                delay = (job.next_run - datetime.now()).total_seconds()
+                if delay > 0:
+                    if announced != (job.name, job.next_run):
+                        announced = (job.name, job.next_run)
+                        logger.info("Next: %s at %s", job.name, job.next_run.strftime("%a %Y-%m-%d %H:%M"))
+                    self._stop.wait(min(delay, SCHEDULER_MAX_SLEEP))
+                    continue
+                self._submit(job, job.next_run)
+                # Slots that passed meanwhile (e.g. while suspended) are not replayed.
+                job.next_run = job.cadence.next_after(max(job.next_run, datetime.now()))
+        except KeyboardInterrupt:
+            logger.info("Scheduler stopped.")
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -2,13 +2,19 @@
 
 import logging
 from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
 
 import requests
 
 from src.config import (
-    CTGOV_API_BASE, CTGOV_SEARCH_TERMS, CTGOV_MAX_RESULTS,
-    LOOKBACK_DAYS, TRIAL_INCLUDED_PHASES, RELEVANCE_REQUIRED_KEYWORDS,
+    CTGOV_API_BASE, CTGOV_SEARCH_TERMS, CTGOV_PAGE_SIZE, CTGOV_IDS_BATCH,
+    LOOKBACK_DAYS, TRIAL_INCLUDED_PHASES, TRIAL_DIFF_FIELDS,
 )
+from src.dates import to_timestamp
+from src.http_cache import http_cache
+from src.instrumentation import count, span
+from src.item_store import item_store
+from src.keyword_matcher import RELEVANCE_MATCHER
 
 logger = logging.getLogger(__name__)
 
@@ -16,119 +22,267 @@ REQUEST_TIMEOUT = 20
 HEADERS = {
     "User-Agent": "MASH-Newsletter-Agent/1.0 (research aggregator)"
 }
+_FULL_FIELDS = (
+    "NCTId,BriefTitle,OverallStatus,LeadSponsorName,StartDate,LastUpdatePostDate,"
+    "BriefSummary,Phase,Condition,InterventionName"
+)
+_DIFF_FIELDS = ",".join(["NCTId", "LastUpdatePostDate", *TRIAL_DIFF_FIELDS.values()])
 
 
-def fetch_trials(query: str, max_results: int, cutoff_date: str) -> list[dict]:
-    """Fetch clinical trials matching the query from ClinicalTrials.gov v2 API."""
+def _search_params(query: str, cutoff_date: str, fields: str, page_size: int = CTGOV_PAGE_SIZE) -> dict:
+    """Query parameters for Phase 2+ trials matching a term and updated since cutoff_date."""
     # Filter to Phase 2+ only via API
     phase_filter = " OR ".join(f"AREA[Phase]{p}" for p in TRIAL_INCLUDED_PHASES if p != "NA")
-    params = {
+    return {
         "query.term": query,
         "filter.advanced": f"AREA[LastUpdatePostDate]RANGE[{cutoff_date},MAX] AND ({phase_filter})",
-        "pageSize": max_results,
+        "pageSize": page_size,
         "sort": "LastUpdatePostDate:desc",
-        "fields": "NCTId,BriefTitle,OverallStatus,LeadSponsorName,StartDate,LastUpdatePostDate,BriefSummary,Phase,Condition,InterventionName",
+        "fields": fields,
         "format": "json",
     }
 
-    try:
-        resp = requests.get(
-            CTGOV_API_BASE, params=params,
-            headers=HEADERS, timeout=REQUEST_TIMEOUT
-        )
-        resp.raise_for_status()
-        data = resp.json()
-    except requests.RequestException as e:
-        logger.warning("ClinicalTrials.gov query failed for '%s': %s", query, e)
-        return []
-
-    trials = []
-    studies = data.get("studies", [])
-    for study in studies:
-        proto = study.get("protocolSection", {})
-        ident = proto.get("identificationModule", {})
-        status_mod = proto.get("statusModule", {})
-        sponsor_mod = proto.get("sponsorCollaboratorsModule", {})
-        desc_mod = proto.get("descriptionModule", {})
-        design_mod = proto.get("designModule", {})
-        cond_mod = proto.get("conditionsModule", {})
-        intervention_mod = proto.get("armsInterventionsModule", {})
-
-        nct_id = ident.get("nctId", "")
-        title = ident.get("briefTitle", "Untitled")
-        status = status_mod.get("overallStatus", "Unknown")
-        last_update = status_mod.get("lastUpdatePostDateStruct", {}).get("date", "Unknown")
-
-        sponsor = ""
-        lead = sponsor_mod.get("leadSponsor", {})
-        if lead:
-            sponsor = lead.get("name", "")
-
-        summary = desc_mod.get("briefSummary", "")
-        if isinstance(summary, dict):
-            summary = summary.get("textBlock", "")
-        if len(summary) > 400:
-            summary = summary[:397] + "..."
-
-        phases = design_mod.get("phases", [])
-        phase_str = ", ".join(phases) if phases else "N/A"
-
-        conditions = cond_mod.get("conditions", [])
-
-        interventions = []
-        if intervention_mod:
-            for intv in intervention_mod.get("interventions", []):
-                interventions.append(intv.get("name", ""))
-
-        # Skip Phase 1 / Early Phase 1 trials
-        phases_upper = [p.upper().replace(" ", "") for p in phases]
-        if any(p in ("PHASE1", "EARLYPHASE1") for p in phases_upper):
-            continue
 
-        trials.append({
-            "title": title,
-            "link": f"https://clinicaltrials.gov/study/{nct_id}",
-            "nct_id": nct_id,
-            "status": status,
-            "sponsor": sponsor,
-            "phase": phase_str,
-            "conditions": conditions,
-            "interventions": interventions[:3],
-            "description": summary,
-            "date": last_update,
-            "source": "ClinicalTrials.gov",
-            "type": "clinical_trial",
-        })
-
-    logger.info("Fetched %d trials from ClinicalTrials.gov for '%s'", len(trials), query)
-    return trials
+def _get_studies(params: dict, label: str) -> Iterator[dict]:
+    """
+    Yield raw v2 study records for a query.
+
+    Follows nextPageToken until the result set is exhausted, so callers can
+    consume studies lazily without holding every page in memory. Raises if
+    a page cannot be fetched.
+    """
+    studies_seen = 0
+    pages = 0
+    while True:
+        try:
+            resp = http_cache.request(
+                "ctgov", "GET", CTGOV_API_BASE, params=params,
+                headers=HEADERS, timeout=REQUEST_TIMEOUT
+            )
+            resp.raise_for_status()
+            data = resp.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(
+                "ClinicalTrials.gov query failed for %s on page %d: %s", label, pages + 1, e
+            )
+            raise
+        pages += 1
+
+        studies = data.get("studies", [])
+        studies_seen += len(studies)
+        yield from studies
+
+        token = data.get("nextPageToken")
+        if not token:
+            break
+        params["pageToken"] = token
+
+    logger.info(
+        "Fetched %d studies from ClinicalTrials.gov for %s (%d page%s)",
+        studies_seen, label, pages, "" if pages == 1 else "s",
+    )
+
+
+def scan_trials(query: str, cutoff_date: str) -> Iterator[dict]:
+    """Yield the compared fields (see _project) of every trial matching the query."""
+    params = _search_params(query, cutoff_date, _DIFF_FIELDS)
+    for study in _get_studies(params, f"'{query}'"):
+        snapshot = _project(study)
+        if snapshot:
+            yield snapshot
+
+
+def fetch_trials_by_id(nct_ids: list[str]) -> Iterator[dict]:
+    """Yield full trial records for the given NCT IDs, CTGOV_IDS_BATCH per request."""
+    for start in range(0, len(nct_ids), CTGOV_IDS_BATCH):
+        batch = nct_ids[start:start + CTGOV_IDS_BATCH]
+        params = {
+            "filter.ids": ",".join(batch),
+            "pageSize": len(batch),
+            "fields": _FULL_FIELDS,
+            "format": "json",
+        }
+        for study in _get_studies(params, f"{len(batch)} NCT IDs"):
+            trial = _parse_study(study)
+            if trial:
+                yield trial
+
+
+def _project(study: dict) -> Optional[dict]:
+    """Reduce a study to its NCT ID, update date and TRIAL_DIFF_FIELDS, or None for Phase 1 trials."""
+    proto = study.get("protocolSection", {})
+    status_mod = proto.get("statusModule", {})
+    phases = proto.get("designModule", {}).get("phases", [])
+
+    # Skip Phase 1 / Early Phase 1 trials
+    phases_upper = [p.upper().replace(" ", "") for p in phases]
+    if any(p in ("PHASE1", "EARLYPHASE1") for p in phases_upper):
+        return None
+
+    lead = proto.get("sponsorCollaboratorsModule", {}).get("leadSponsor", {})
+    return {
+        "nct_id": proto.get("identificationModule", {}).get("nctId", ""),
+        "date": status_mod.get("lastUpdatePostDateStruct", {}).get("date", "Unknown"),
+        "status": status_mod.get("overallStatus", "Unknown"),
+        "phase": ", ".join(phases) if phases else "N/A",
+        "sponsor": lead.get("name", "") if lead else "",
+    }
+
+
+def _diff(old: dict, new: dict) -> list[dict]:
+    """Field-level changes between two snapshots, in TRIAL_DIFF_FIELDS order."""
+    return [
+        {"field": field, "old": old.get(field), "new": new[field]}
+        for field in TRIAL_DIFF_FIELDS
+        if old.get(field) != new[field]
+    ]
+
+
+def _parse_study(study: dict) -> Optional[dict]:
+    """Convert one v2 API study record into a trial dict, or None for Phase 1 trials."""
+    snapshot = _project(study)
+    if snapshot is None:
+        return None
+
+    proto = study.get("protocolSection", {})
+    desc_mod = proto.get("descriptionModule", {})
+    cond_mod = proto.get("conditionsModule", {})
+    intervention_mod = proto.get("armsInterventionsModule", {})
+
+    nct_id = snapshot["nct_id"]
+    title = proto.get("identificationModule", {}).get("briefTitle", "Untitled")
+
+    summary = desc_mod.get("briefSummary", "")
+    if isinstance(summary, dict):
+        summary = summary.get("textBlock", "")
+    if len(summary) > 400:
+        summary = summary[:397] + "..."
+
+    conditions = cond_mod.get("conditions", [])
+
+    interventions = []
+    if intervention_mod:
+        for intv in intervention_mod.get("interventions", []):
+            interventions.append(intv.get("name", ""))
+
+    return {
+        "title": title,
+        "link": f"https://clinicaltrials.gov/study/{nct_id}",
+        "nct_id": nct_id,
+        "status": snapshot["status"],
+        "sponsor": snapshot["sponsor"],
+        "phase": snapshot["phase"],
+        "conditions": conditions,
+        "interventions": interventions[:3],
+        "description": summary,
+        "date": snapshot["date"],
+        "timestamp": to_timestamp(snapshot["date"]),
+        "source": "ClinicalTrials.gov",
+        "type": "clinical_trial",
+    }
+
+
+class TrialUpdates(list):
+    """
+    The trials returned by fetch_trial_updates, plus the snapshots
+    (nct_id -> compared fields) to save once they have been stored.
+    """
+
+    def __init__(self, trials: list[dict], snapshots: dict[str, dict]):
+        super().__init__(trials)
+        self.snapshots = snapshots
+
+
+def _is_relevant(trial: dict) -> bool:
+    """Post-fetch relevance filter: title or conditions must mention MASH/NASH/liver."""
+    text = f"{trial['title']} {' '.join(trial.get('conditions', []))} {trial.get('description', '')}"
+    if not RELEVANCE_MATCHER.search(text):
+        logger.info("Excluded irrelevant trial: %s", trial["title"])
+        count("filter.rejected", filter="trials.relevance")
+        return False
+    count("filter.kept", filter="trials.relevance")
+    return True
 
 
 def fetch_all_trials(lookback_days: int = LOOKBACK_DAYS) -> list[dict]:
-    """Run all configured trial searches and return deduplicated results."""
+    """Run all configured trial searches and return every relevant trial updated in the window."""
     cutoff = datetime.now(timezone.utc) - timedelta(days=lookback_days)
     cutoff_str = cutoff.strftime("%Y-%m-%d")
 
-    all_trials = []
+    filtered = []
     seen_nct = set()
+    for term in CTGOV_SEARCH_TERMS:
+        params = _search_params(term, cutoff_str, _FULL_FIELDS)
+        for study in _get_studies(params, f"'{term}'"):
+            trial = _parse_study(study)
+            if not trial or trial["nct_id"] in seen_nct:
+                continue
+            seen_nct.add(trial["nct_id"])
+            if _is_relevant(trial):
+                filtered.append(trial)
+
+    filtered.sort(key=lambda x: x["timestamp"], reverse=True)
+    logger.info("Total unique trials after filtering: %d (excluded %d)", len(filtered), len(seen_nct) - len(filtered))
+    return filtered
 
+
+def fetch_trial_updates(lookback_days: int = LOOKBACK_DAYS) -> TrialUpdates:
+    """
+    Return trials that are new or whose status, phase or sponsor changed.
+
+    A first pass fetches only the compared fields of every trial updated in
+    the window; these are diffed in bulk against the snapshots from earlier
+    runs, and full records are then fetched by NCT ID for the changed trials
+    only. Each result carries `changes` ([{field, old, new}]) and `is_new`.
+    On the first run, with no snapshots yet, every trial is reported as is.
+
+    Nothing is saved here: the caller saves `.snapshots` once the trials
+    are stored, so a result that is dropped is reported again next time.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=lookback_days)
+    cutoff_str = cutoff.strftime("%Y-%m-%d")
+
+    current = {}
     for term in CTGOV_SEARCH_TERMS:
-        results = fetch_trials(term, CTGOV_MAX_RESULTS, cutoff_str)
-        for trial in results:
-            if trial["nct_id"] not in seen_nct:
-                seen_nct.add(trial["nct_id"])
-                all_trials.append(trial)
+        for snapshot in scan_trials(term, cutoff_str):
+            current.setdefault(snapshot["nct_id"], snapshot)
+
+    with span("filter", filter="trials.diff"):
+        baseline = not item_store.has_trial_snapshots()
+        previous = item_store.trial_snapshots(current)
+        changes = {}
+        for nct_id, snapshot in current.items():
+            if nct_id not in previous:
+                changes[nct_id] = None
+            else:
+                diff = _diff(previous[nct_id], snapshot)
+                if diff:
+                    changes[nct_id] = diff
+    count("filter.rejected", len(current) - len(changes), filter="trials.diff")
+    new_count = sum(1 for diff in changes.values() if diff is None)
+    logger.info(
+        "%d trials updated in window: %d new, %d changed, %d without tracked changes",
+        len(current), new_count, len(changes) - new_count, len(current) - len(changes),
+    )
 
-    # Post-fetch relevance filter: title or conditions must mention MASH/NASH/liver
     filtered = []
-    for trial in all_trials:
-        text = f"{trial['title']} {' '.join(trial.get('conditions', []))} {trial.get('description', '')}"
-        text_lower = text.lower()
-        if any(kw.lower() in text_lower for kw in RELEVANCE_REQUIRED_KEYWORDS):
-            filtered.append(trial)
-        else:
-            logger.info("Excluded irrelevant trial: %s", trial["title"])
-
-    filtered.sort(key=lambda x: x["date"], reverse=True)
-    logger.info("Total unique trials after filtering: %d (excluded %d)", len(filtered), len(all_trials) - len(filtered))
-    return filtered
+    fetched = set()
+    for trial in fetch_trials_by_id(list(changes)):
+        nct_id = trial["nct_id"]
+        if nct_id not in changes or nct_id in fetched:
+            continue
+        fetched.add(nct_id)
+        if not _is_relevant(trial):
+            continue
+        trial["changes"] = changes[nct_id] or []
+        trial["is_new"] = changes[nct_id] is None and not baseline
+        filtered.append(trial)
+
+    filtered.sort(key=lambda x: x["timestamp"], reverse=True)
+    logger.info("Total trial updates after filtering: %d (excluded %d)", len(filtered), len(fetched) - len(filtered))
+    # A changed trial whose full record could not be fetched keeps its old
+    # snapshot, so the change is picked up again on the next run.
+    return TrialUpdates(filtered, {
+        nct_id: snapshot for nct_id, snapshot in current.items()
+        if nct_id not in changes or nct_id in fetched
+    })
@@ -8,6 +8,8 @@ with live API calls when running in an unrestricted environment.
 import logging
 from datetime import datetime, timezone
 
+from src.dates import to_timestamp
+
 logger = logging.getLogger(__name__)
 
 
@@ -374,6 +376,8 @@ def fetch_all_curated_content() -> tuple[list[dict], list[dict], list[dict]]:
     news = get_curated_news()
     pubs = get_curated_publications()
     trials = get_curated_trials()
+    for item in (*news, *pubs, *trials):
+        item["timestamp"] = to_timestamp(item["date"])
     logger.info(
         "Loaded curated content: %d news, %d publications, %d trials",
         len(news), len(pubs), len(trials),